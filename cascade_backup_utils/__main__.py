@@ -1,20 +1,395 @@
 """Command-line interface for Cascade Backup Utils."""
 
+import argparse
+import glob
+import logging
+import os
 import sys
+from datetime import datetime
 from cascade_backup_utils.backup import CascadeBackup
-from cascade_backup_utils.consolidate import BackupConsolidator
+from cascade_backup_utils.consolidate import BackupConsolidator, consolidate_projects
+from cascade_backup_utils.delta import DEFAULT_KEYFRAME_INTERVAL
+from cascade_backup_utils.encoding import replace_undecodable
+from cascade_backup_utils.encryption import EncryptionError, load_key, write_keyfile
+from cascade_backup_utils.export import EXPORT_FORMATS
+from cascade_backup_utils.index import ConsolidatedReader, SectionIndexError
+from cascade_backup_utils.metrics import REGISTRY
+from cascade_backup_utils.prune import RetentionPolicy, prune
+from cascade_backup_utils.serve import (
+    DEFAULT_POLL_INTERVAL,
+    DEFAULT_PORT,
+    ConsolidationService,
+    start_http_server,
+)
 
 
-def backup_main():
-    """Entry point for backup command."""
+class _StderrHandler(logging.StreamHandler):
+    """Log to the current sys.stderr, even if it was replaced after setup."""
+
+    def emit(self, record):
+        self.stream = sys.stderr
+        super().emit(record)
+
+
+def _configure_logging(verbose=False, quiet=False):
+    """Send the package's log messages to stderr at the chosen verbosity."""
+    package_logger = logging.getLogger("cascade_backup_utils")
+    handler = next(
+        (h for h in package_logger.handlers if isinstance(h, _StderrHandler)), None
+    )
+    if handler is None:
+        handler = _StderrHandler()
+        package_logger.addHandler(handler)
+    if verbose:
+        package_logger.setLevel(logging.DEBUG)
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        )
+    else:
+        package_logger.setLevel(logging.WARNING if quiet else logging.INFO)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+
+
+def _command_parser(command, metrics=False, keyfile=False):
+    """Create a command's parser with the shared verbosity options.
+
+    Args:
+        command: Command name, used in usage messages.
+        metrics: If True, add --metrics-file.
+        keyfile: If True, add --keyfile for commands that read backups.
+    """
+    parser = argparse.ArgumentParser(prog=f"cascade-backup-utils {command}")
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument(
+        "-v", "--verbose", action="store_true", help="log every file processed"
+    )
+    verbosity.add_argument(
+        "-q", "--quiet", action="store_true", help="only log warnings and errors"
+    )
+    if metrics:
+        parser.add_argument(
+            "--metrics-file",
+            help="write metrics to this file when done "
+            "(JSON for .json, Prometheus text format otherwise)",
+        )
+    if keyfile:
+        parser.add_argument(
+            "--keyfile", help="file containing the key for encrypted backups"
+        )
+    return parser
+
+
+def _parse_args(parser, args):
+    """Parse a command's arguments and configure logging from them."""
+    options = parser.parse_args(args)
+    _configure_logging(options.verbose, options.quiet)
+    return options
+
+
+def _load_keyfile(options):
+    """Load the key from --keyfile, or None to use the environment's key."""
+    if not options.keyfile:
+        return None
+    try:
+        return load_key(options.keyfile)
+    except EncryptionError as e:
+        print(str(e))
+        sys.exit(1)
+
+
+def _write_metrics(options):
+    """Write collected metrics to --metrics-file, if given."""
+    if options.metrics_file:
+        try:
+            REGISTRY.write(options.metrics_file)
+        except OSError as e:
+            print(f"Error writing metrics: {str(e)}")
+
+
+def _backup(args):
+    """Create a backup of the current conversation."""
+    parser = _command_parser("backup", metrics=True)
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="store the backup as a delta against the previous backup",
+    )
+    parser.add_argument(
+        "--keyframe-interval",
+        type=int,
+        default=DEFAULT_KEYFRAME_INTERVAL,
+        help="write a full backup after this many deltas",
+    )
+    parser.add_argument(
+        "--encrypt",
+        action="store_true",
+        help="encrypt the backup with the key from the environment or --keyfile",
+    )
+    parser.add_argument("--keyfile", help="file containing the encryption key")
+    parser.add_argument(
+        "--attachments",
+        action="store_true",
+        help="attach images and files copied to the clipboard after the text",
+    )
+    options = _parse_args(parser, args)
+    if options.encrypt and options.delta:
+        parser.error("--encrypt cannot be combined with --delta")
+    # Blobs are stored unencrypted, so they would leak encrypted content
+    if (options.encrypt or options.keyfile) and options.attachments:
+        parser.error("--attachments cannot be combined with encryption")
+
+    key = None
+    if options.encrypt or options.keyfile:
+        try:
+            key = load_key(options.keyfile)
+        except EncryptionError as e:
+            print(str(e))
+            sys.exit(1)
+
     backup = CascadeBackup()
+    backup.delta_encoding = options.delta
+    backup.keyframe_interval = options.keyframe_interval
+    backup.encryption_key = key
+    backup.capture_attachments = options.attachments
     backup.backup()
+    _write_metrics(options)
+
+
+def backup_main():
+    """Entry point for backup command."""
+    _backup(sys.argv[1:])
+
+
+def _consolidate(args):
+    """Consolidate backups, merging any extra directories into the first."""
+    parser = _command_parser("consolidate", metrics=True, keyfile=True)
+    parser.add_argument("dirs", nargs="*", help="backup directories")
+    parser.add_argument(
+        "--memory-limit",
+        type=float,
+        help="keep memory use under about this many MiB, using disk instead",
+    )
+    parser.add_argument("--workers", type=int, help="number of worker threads")
+    options = _parse_args(parser, args)
+
+    if options.dirs:
+        consolidator = BackupConsolidator(options.dirs[0], extra_dirs=options.dirs[1:])
+    else:
+        consolidator = BackupConsolidator()
+    consolidator.key = _load_keyfile(options)
+    consolidator.memory_limit = options.memory_limit
+    consolidator.consolidate(options.workers)
+    _write_metrics(options)
 
 
 def consolidate_main():
     """Entry point for consolidate command."""
-    consolidator = BackupConsolidator()
-    consolidator.consolidate()
+    _consolidate(sys.argv[1:])
+
+
+def _batch(args):
+    """Consolidate many project backup directories in one run."""
+    parser = _command_parser("batch", metrics=True, keyfile=True)
+    parser.add_argument("dirs", nargs="+", help="backup directories or glob patterns")
+    parser.add_argument(
+        "--global", dest="global_file", help="also write all projects to this file"
+    )
+    parser.add_argument("--workers", type=int, help="number of worker threads")
+    options = _parse_args(parser, args)
+    key = _load_keyfile(options)
+
+    backup_dirs = []
+    for pattern in options.dirs:
+        for path in sorted(glob.glob(os.path.expanduser(pattern))):
+            if os.path.isdir(path) and path not in backup_dirs:
+                backup_dirs.append(path)
+
+    if not backup_dirs:
+        print("No backup directories matched.")
+        sys.exit(1)
+
+    consolidate_projects(backup_dirs, options.global_file, options.workers, key)
+    _write_metrics(options)
+
+
+def _positive_int(value):
+    """Parse a count that must be at least 1."""
+    try:
+        count = int(value)
+    except ValueError:
+        count = 0
+    if count < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer: {value!r}")
+    return count
+
+
+def _prune(args):
+    """Delete backups not kept by a retention policy."""
+    parser = _command_parser("prune", keyfile=True)
+    parser.add_argument("dir", nargs="?", help="backup directory")
+    parser.add_argument(
+        "--keep-last", type=_positive_int, help="keep the N newest backups"
+    )
+    parser.add_argument(
+        "--keep-daily", type=_positive_int, help="keep one backup per day"
+    )
+    parser.add_argument(
+        "--keep-weekly", type=_positive_int, help="keep one backup per week"
+    )
+    parser.add_argument(
+        "--keep-monthly", type=_positive_int, help="keep one backup per month"
+    )
+    parser.add_argument(
+        "--drop-contained",
+        action="store_true",
+        help="drop backups fully contained in a newer backup",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only list what would be deleted"
+    )
+    options = _parse_args(parser, args)
+
+    policy = RetentionPolicy(
+        keep_last=options.keep_last,
+        keep_daily=options.keep_daily,
+        keep_weekly=options.keep_weekly,
+        keep_monthly=options.keep_monthly,
+        drop_contained=options.drop_contained,
+    )
+    if not policy.has_time_rules and not policy.drop_contained:
+        print("No retention policy given; nothing to prune.")
+        sys.exit(1)
+
+    key = _load_keyfile(options)
+    backup_dir = options.dir or BackupConsolidator().backup_dir
+    prune(backup_dir, policy, dry_run=options.dry_run, key=key)
+
+
+def _export(args):
+    """Export cleaned conversations as JSON Lines or Parquet."""
+    parser = _command_parser("export", metrics=True, keyfile=True)
+    parser.add_argument("output", help="file to write (.jsonl or .parquet)")
+    parser.add_argument("--dir", help="backup directory")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, help="output format")
+    options = _parse_args(parser, args)
+
+    consolidator = BackupConsolidator(options.dir, key=_load_keyfile(options))
+    try:
+        consolidator.export(options.output, options.format)
+    except ImportError as e:
+        print(str(e))
+        sys.exit(1)
+    _write_metrics(options)
+
+
+def _rename(args):
+    """Rename legacy backup files to the timestamped naming scheme."""
+    parser = _command_parser("rename", keyfile=True)
+    parser.add_argument("dir", nargs="?", help="backup directory")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only list what would be renamed"
+    )
+    options = _parse_args(parser, args)
+
+    consolidator = BackupConsolidator(options.dir, key=_load_keyfile(options))
+    consolidator.rename_legacy_files(dry_run=options.dry_run)
+
+
+def _local_time(value):
+    """Parse an ISO 8601 time for --at, as a naive local time.
+
+    Backup timestamps are naive local times, so a time with a UTC offset is
+    converted to local time first.
+    """
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time: {value!r}")
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return timestamp
+
+
+def _show(args):
+    """Print the consolidated conversation current at a point in time."""
+    parser = _command_parser("show")
+    parser.add_argument("dir", nargs="?", help="backup directory")
+    parser.add_argument(
+        "--at",
+        required=True,
+        type=_local_time,
+        help="time to look up, e.g. 2025-02-10T00:10",
+    )
+    parser.add_argument("--file", help="consolidated file to read")
+    options = _parse_args(parser, args)
+
+    path = options.file or BackupConsolidator(options.dir).consolidated_file
+    try:
+        with ConsolidatedReader(path) as reader:
+            section = reader.at(options.at)
+    except FileNotFoundError:
+        print(f"No consolidated file with an index found at: {path}")
+        print("Run cascade-consolidate first.")
+        sys.exit(1)
+    except SectionIndexError as e:
+        print(str(e))
+        sys.exit(1)
+
+    if section is None:
+        print(f"No conversation found at or before {options.at}")
+        sys.exit(1)
+    print(replace_undecodable(section))
+
+
+def _keygen(args):
+    """Create a keyfile for encrypted backups."""
+    parser = _command_parser("keygen")
+    parser.add_argument("keyfile", help="file to write the new key to")
+    options = _parse_args(parser, args)
+
+    try:
+        write_keyfile(options.keyfile)
+    except OSError as e:
+        print(f"Error writing keyfile: {str(e)}")
+        sys.exit(1)
+    print(f"Key saved to: {options.keyfile}")
+    print("Keep a copy somewhere safe: encrypted backups cannot be read without it.")
+
+
+def _serve(args):
+    """Keep the consolidated file up to date as new backups land."""
+    parser = _command_parser("serve", keyfile=True)
+    parser.add_argument("dir", nargs="?", help="backup directory")
+    parser.add_argument(
+        "--port", type=int, default=DEFAULT_PORT, help="local HTTP status port"
+    )
+    parser.add_argument("--no-http", action="store_true", help="disable HTTP")
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        help="seconds between checks for new backups",
+    )
+    options = _parse_args(parser, args)
+
+    consolidator = BackupConsolidator(options.dir, key=_load_keyfile(options))
+    os.makedirs(consolidator.backup_dir, exist_ok=True)
+    service = ConsolidationService(consolidator, options.interval)
+
+    server = None
+    if not options.no_http:
+        server = start_http_server(service, port=options.port)
+        print(f"Status available at http://127.0.0.1:{server.server_port}/status")
+        print(f"Metrics available at http://127.0.0.1:{server.server_port}/metrics")
+
+    print(f"Watching {consolidator.backup_dir} (Ctrl+C to stop)")
+    try:
+        service.run()
+    except KeyboardInterrupt:
+        print("Stopping.")
+    finally:
+        if server:
+            server.shutdown()
 
 
 def main():
@@ -24,16 +399,36 @@ def main():
         print("Commands:")
         print("  backup      Create a new backup of the current conversation")
         print("  consolidate Consolidate all backup files into a single file")
+        print("              (pass directories to merge several backup dirs)")
+        print("  batch       Consolidate each of many project directories")
+        print("  prune       Delete old backups according to a retention policy")
+        print("  export      Export conversations as JSON Lines or Parquet")
+        print("  rename      Rename legacy backups to timestamped file names")
+        print("  serve       Keep the consolidated file updated as backups land")
+        print("  keygen      Create a keyfile for encrypted backups")
+        print("  show        Show the consolidated conversation at a point in time")
         sys.exit(1)
 
     command = sys.argv[1]
 
     if command == "backup":
-        backup = CascadeBackup()
-        backup.backup()
+        _backup(sys.argv[2:])
     elif command == "consolidate":
-        consolidator = BackupConsolidator()
-        consolidator.consolidate()
+        _consolidate(sys.argv[2:])
+    elif command == "batch":
+        _batch(sys.argv[2:])
+    elif command == "prune":
+        _prune(sys.argv[2:])
+    elif command == "export":
+        _export(sys.argv[2:])
+    elif command == "rename":
+        _rename(sys.argv[2:])
+    elif command == "serve":
+        _serve(sys.argv[2:])
+    elif command == "keygen":
+        _keygen(sys.argv[2:])
+    elif command == "show":
+        _show(sys.argv[2:])
     else:
         print(f"Invalid command: {command}")
         sys.exit(1)
@@ -6,11 +6,28 @@ clipboard and saving them as markdown files. It includes retry mechanisms
 and error handling for clipboard operations.
 """
 
+import io
+import logging
 import os
 import time
 from datetime import datetime
 import pyperclip
 import pyautogui
+from PIL import ImageGrab
+
+from cascade_backup_utils.blobs import BlobStore, reference
+from cascade_backup_utils.delta import DEFAULT_KEYFRAME_INTERVAL, write_snapshot
+from cascade_backup_utils.encryption import ENCRYPTED_SUFFIX, write_encrypted
+from cascade_backup_utils.metrics import (
+    CAPTURE_ATTEMPTS,
+    CAPTURE_SECONDS,
+    SAVE_SECONDS,
+    SAVES,
+)
+
+_IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp", ".svg"}
+
+logger = logging.getLogger(__name__)
 
 
 class CascadeBackup:
@@ -22,13 +39,20 @@ class CascadeBackup:
         pyautogui.FAILSAFE = True
         # Maximum number of retry attempts for clipboard operations
         self.max_retries = 3
+        # Store backups as deltas against the previous backup
+        self.delta_encoding = False
+        self.keyframe_interval = DEFAULT_KEYFRAME_INTERVAL
+        # Key for encrypting backups at rest; None writes plaintext
+        self.encryption_key = None
+        # Ask for images and files to attach after copying the text
+        self.capture_attachments = False
 
     def clear_clipboard(self):
         """
         Clear the clipboard before starting the backup process.
         Adds a small delay to ensure the system processes the clear operation.
         """
-        print("Clearing clipboard...")
+        logger.info("Clearing clipboard...")
         pyperclip.copy("")
         time.sleep(1)  # Give system time to clear clipboard
 
@@ -43,10 +67,15 @@ class CascadeBackup:
             str or None: Clipboard content if found, None if clipboard is empty
         """
         for attempt in range(max_attempts):
-            content = pyperclip.paste()
+            with CAPTURE_SECONDS.time():
+                content = pyperclip.paste()
             if content.strip():
+                CAPTURE_ATTEMPTS.inc(result="success")
                 return content
-            print(f"Attempt {attempt + 1}: No content found in clipboard, waiting...")
+            CAPTURE_ATTEMPTS.inc(result="empty")
+            logger.info(
+                "Attempt %d: No content found in clipboard, waiting...", attempt + 1
+            )
             time.sleep(2)  # Wait before next attempt
         return None
 
@@ -76,7 +105,7 @@ class CascadeBackup:
                 content = self.get_clipboard_content()
 
                 if content:
-                    print("Successfully copied conversation text!")
+                    logger.info("Successfully copied conversation text!")
                     return content
 
                 if attempt < self.max_retries - 1:
@@ -84,18 +113,86 @@ class CascadeBackup:
                     if retry != "y":
                         break
 
-            print("Failed to copy conversation text after multiple attempts")
+            logger.error("Failed to copy conversation text after multiple attempts")
             return None
 
         except pyautogui.FailSafeException:
-            print("Operation aborted by moving mouse to corner")
+            logger.warning("Operation aborted by moving mouse to corner")
             return None
         except Exception as e:
-            print(f"An error occurred: {str(e)}")
+            logger.error("An error occurred: %s", e)
             return None
 
-    def _save_backup(self, content):
-        """Save backup content to a markdown file."""
+    def get_clipboard_attachments(self):
+        """
+        Read an image or copied files from the clipboard.
+
+        Returns:
+            list: A PIL image, or paths of the copied files; empty if the
+                  clipboard holds neither or cannot be read
+        """
+        try:
+            content = ImageGrab.grabclipboard()
+        except Exception as e:
+            logger.warning("Could not read attachments from clipboard: %s", e)
+            return []
+        if content is None:
+            return []
+        if isinstance(content, list):
+            return [path for path in content if os.path.isfile(path)]
+        return [content]
+
+    def copy_attachments(self):
+        """
+        Guide the user through attaching images and files to the backup.
+
+        Each item is stored in the blob store of the backup directory, so an
+        image attached to many backups is kept once.
+
+        Returns:
+            list: Markdown references to the stored attachments
+        """
+        store = BlobStore(self.backup_dir)
+        references = []
+        seen = set()
+        while True:
+            print("\nTo attach an image or files, copy them now.")
+            input("Press Enter when copied, or just Enter to finish...")
+            added = 0
+            for item in self.get_clipboard_attachments():
+                # One unreadable item must not lose the conversation text
+                try:
+                    if isinstance(item, str):
+                        path = store.put_file(item)
+                        name = os.path.basename(item)
+                        image = os.path.splitext(name)[1].lower() in _IMAGE_SUFFIXES
+                    else:
+                        buffer = io.BytesIO()
+                        item.save(buffer, format="PNG")
+                        path = store.put_bytes(buffer.getvalue(), "image.png")
+                        name, image = "image", True
+                except (OSError, ValueError) as e:
+                    label = item if isinstance(item, str) else "clipboard image"
+                    logger.warning("Skipping attachment %s: %s", label, e)
+                    continue
+                if path not in seen:
+                    seen.add(path)
+                    references.append(reference(path, name, image))
+                    added += 1
+            # An empty or unchanged clipboard ends the loop
+            if not added:
+                return references
+            logger.info("Attached %d item(s).", added)
+
+    def _save_backup(self, content, attachments=()):
+        """Save backup content to a markdown file.
+
+        With delta_encoding enabled, the backup is stored as a delta against
+        the previous backup when that is smaller (see the delta module).
+        With an encryption_key, the backup is written encrypted as a full
+        snapshot (see the encryption module). Attachment references are
+        appended after the conversation text (see the blobs module).
+        """
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"backup_{timestamp}.md"
         filepath = os.path.join(self.backup_dir, filename)
@@ -103,15 +200,31 @@ class CascadeBackup:
         # Format timestamp for content header
         header = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         content_with_ts = f"*Backup created on: {header}*\n\n{content}"
+        if attachments:
+            content_with_ts += "\n\n" + "\n".join(attachments)
 
+        start = time.perf_counter()
         try:
-            with open(filepath, "w", encoding="utf-8") as file:
-                file.write(content_with_ts)
-            print(f"\nBackup saved to: {filepath}")
+            if self.encryption_key is not None:
+                filepath += ENCRYPTED_SUFFIX
+                write_encrypted(filepath, content_with_ts, self.encryption_key)
+            elif self.delta_encoding:
+                filepath = write_snapshot(
+                    self.backup_dir,
+                    f"backup_{timestamp}",
+                    content_with_ts,
+                    self.keyframe_interval,
+                )
+            else:
+                with open(filepath, "w", encoding="utf-8") as file:
+                    file.write(content_with_ts)
         except Exception as e:
-            err_msg = str(e)
-            print("Error:", err_msg)
-            print("Backup creation failed.")
+            SAVES.inc(result="error")
+            logger.error("Backup creation failed: %s", e)
+            return
+        SAVE_SECONDS.observe(time.perf_counter() - start)
+        SAVES.inc(result="success")
+        logger.info("Backup saved to: %s", filepath)
 
     def backup(self):
         """Backup the current conversation.
@@ -119,16 +232,18 @@ class CascadeBackup:
         This method copies the conversation text from the clipboard
         and saves it as a markdown file with a timestamp.
         """
-        print("Starting Cascade conversation backup...")
+        logger.info("Starting Cascade conversation backup...")
         content = self.copy_conversation()
         if content:
-            self._save_backup(content)
-            print("Backup completed successfully!")
+            attachments = self.copy_attachments() if self.capture_attachments else ()
+            self._save_backup(content, attachments)
+            logger.info("Backup completed successfully!")
         else:
-            print("Backup failed! Please try again.")
+            logger.error("Backup failed! Please try again.")
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     # Create requirements.txt if it doesn't exist
     requirements_path = os.path.join(os.path.dirname(__file__), "requirements.txt")
     if not os.path.exists(requirements_path):
@@ -0,0 +1,119 @@
+"""Module for storing backup attachments in a content-addressed blob store.
+
+Images and files captured with a backup are stored once, under
+blobs/<first two hex digits>/<sha256><extension> in the backup directory,
+however many backups include them. The backup's markdown refers to them by
+relative path::
+
+    ![image](blobs/3f/3f2a...e1.png)
+    [report.pdf](blobs/9c/9c41...07.pdf)
+
+Consolidation only carries these references; blobs are never read or copied,
+so attachments add no cost to the text path.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+
+BLOBS_DIRNAME = "blobs"
+
+_REFERENCE = re.compile(
+    r"^\s*!?\[[^\]\n]*\]\((?:[^()\s]*/)?blobs/[0-9a-f]{2}/[0-9a-f]{64}(?:\.\w+)?\)\s*$"
+)
+_REFERENCE_TARGET = re.compile(
+    r"^(\s*!?\[[^\]\n]*\]\()(blobs/[0-9a-f]{2}/[0-9a-f]{64}(?:\.\w+)?\)\s*)$",
+    re.MULTILINE,
+)
+_SUFFIX = re.compile(r"^\.\w{1,16}$")
+_READ_SIZE = 1024 * 1024
+
+
+def is_reference(line):
+    """Return True if the line is an attachment reference."""
+    return bool(_REFERENCE.match(line))
+
+
+def reference(path, name, image=False):
+    """Format a markdown reference to a stored blob.
+
+    Args:
+        path: Blob path relative to the backup directory.
+        name: Link text, e.g. the original file name.
+        image: If True, format an image embed.
+    """
+    name = name.replace("[", "(").replace("]", ")").replace("\n", " ")
+    return f"{'!' if image else ''}[{name}]({path})"
+
+
+def rebase_references(text, prefix):
+    """Prefix the path of every attachment reference in text.
+
+    Used when a backup is consolidated into a file in another directory, so
+    its references still point at the blobs of its own backup directory.
+    """
+    if "blobs/" not in text:
+        return text
+    return _REFERENCE_TARGET.sub(rf"\g<1>{prefix}/\g<2>", text)
+
+
+def _suffix(name):
+    suffix = os.path.splitext(name)[1].lower()
+    return suffix if _SUFFIX.match(suffix) else ""
+
+
+class BlobStore:
+    """Content-addressed store of attachment files in a backup directory."""
+
+    def __init__(self, backup_dir):
+        self.backup_dir = backup_dir
+        self.root = os.path.join(backup_dir, BLOBS_DIRNAME)
+
+    def _put(self, chunks, name):
+        """Hash and store byte chunks in one pass.
+
+        The data is written to a temporary file that is renamed into place,
+        or discarded if a blob with the same digest is already stored.
+
+        Returns:
+            Path of the blob relative to the backup directory.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            sha = hashlib.sha256()
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    sha.update(chunk)
+                    f.write(chunk)
+            digest = sha.hexdigest()
+            relative_path = f"{BLOBS_DIRNAME}/{digest[:2]}/{digest}{_suffix(name)}"
+            path = os.path.join(self.backup_dir, *relative_path.split("/"))
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return relative_path
+
+    def put_bytes(self, data, name=""):
+        """Store data, keeping the extension of name.
+
+        Returns:
+            Path of the blob relative to the backup directory.
+        """
+        return self._put([data], name)
+
+    def put_file(self, source):
+        """Store a copy of the file at source without reading it into memory.
+
+        Returns:
+            Path of the blob relative to the backup directory.
+        """
+        with open(source, "rb") as f:
+            return self._put(iter(lambda: f.read(_READ_SIZE), b""), source)
@@ -0,0 +1,141 @@
+"""Module for resuming interrupted consolidations.
+
+While consolidating, output goes to a ".partial" file next to the
+consolidated file and progress is saved periodically to a ".checkpoint"
+file. If the run is killed, the next run truncates the partial output back to
+the last checkpoint and continues after the last backup it covers instead of
+starting over. The partial file replaces the consolidated file only once it
+is complete, so an interrupted run never leaves a truncated result.
+
+A checkpoint is JSON with:
+- sources: backup directories and noise-rules digest the run was started with
+- last_path: the last backup written to the partial output
+- last_timestamp: timestamp of that backup
+- covered: count and hash of the paths of every backup up to last_path, in
+  order, so that backups added among them are noticed whatever their mtime
+- written: number of sections in the partial output
+- offset: size of the partial output in bytes
+- digests: digests of every section written so far
+- digest_rows: in bounded-memory mode, the digests are kept in a SQLite
+  store instead and this is the number of rows committed to it
+"""
+
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+
+PARTIAL_SUFFIX = ".partial"
+CHECKPOINT_SUFFIX = ".checkpoint"
+
+# Minimum number of seconds between checkpoints
+DEFAULT_CHECKPOINT_INTERVAL = 5.0
+
+_VERSION = 2
+
+logger = logging.getLogger(__name__)
+
+
+class PathFingerprint:
+    """Running count and hash of backup paths, in the order they are added."""
+
+    def __init__(self):
+        self.count = 0
+        self._hash = hashlib.sha256()
+
+    def add(self, path):
+        self.count += 1
+        self._hash.update(os.fsencode(path) + b"\0")
+
+    def value(self):
+        """Return the fingerprint as a JSON-serializable dict."""
+        return {"count": self.count, "sha256": self._hash.hexdigest()}
+
+
+class Checkpoint:
+    """Progress of a consolidation, as saved to its checkpoint file."""
+
+    def __init__(
+        self,
+        sources,
+        last_path=None,
+        last_timestamp=None,
+        covered=None,
+        written=0,
+        offset=0,
+        digests=None,
+        digest_rows=None,
+    ):
+        self.sources = sources
+        self.last_path = last_path
+        self.last_timestamp = last_timestamp
+        self.covered = covered
+        self.written = written
+        self.offset = offset
+        self.digests = set(digests or ())
+        self.digest_rows = digest_rows
+
+    @classmethod
+    def load(cls, path, sources):
+        """Load the checkpoint at path if it belongs to a run over sources.
+
+        Returns:
+            Checkpoint, or None if there is no usable checkpoint.
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable checkpoint %s: %s", path, e)
+            return None
+
+        if (
+            not isinstance(data, dict)
+            or data.get("version") != _VERSION
+            or data.get("sources") != sources
+        ):
+            return None
+        try:
+            return cls(
+                sources,
+                data["last_path"],
+                datetime.fromisoformat(data["last_timestamp"]),
+                data["covered"],
+                int(data["written"]),
+                int(data["offset"]),
+                data["digests"],
+                data.get("digest_rows"),
+            )
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def save(self, path):
+        """Write the checkpoint atomically."""
+        data = {
+            "version": _VERSION,
+            "sources": self.sources,
+            "last_path": self.last_path,
+            "last_timestamp": self.last_timestamp.isoformat(),
+            "covered": self.covered,
+            "written": self.written,
+            "offset": self.offset,
+            "digests": sorted(self.digests),
+            "digest_rows": self.digest_rows,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+def remove_file(path):
+    """Delete path if it exists."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -10,18 +10,245 @@ Features:
 - Cleans up UI elements and system messages
 """
 
+import collections
+import functools
+import hashlib
+import heapq
+import itertools
+import logging
 import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime
+from typing import NamedTuple
+
+from cascade_backup_utils.blobs import rebase_references
+from cascade_backup_utils.checkpoint import (
+    CHECKPOINT_SUFFIX,
+    DEFAULT_CHECKPOINT_INTERVAL,
+    PARTIAL_SUFFIX,
+    Checkpoint,
+    PathFingerprint,
+    remove_file,
+)
+from cascade_backup_utils.delta import (
+    DELTA_SUFFIX,
+    is_delta,
+    read_added_text,
+    read_snapshot,
+)
+from cascade_backup_utils.encoding import (
+    decode_backup,
+    encode_text,
+    read_backup_file,
+)
+from cascade_backup_utils.encryption import (
+    ENCRYPTED_SUFFIX,
+    is_encrypted,
+    load_key,
+    read_encrypted,
+    read_encrypted_head,
+)
+from cascade_backup_utils.export import export_records
+from cascade_backup_utils.external import (
+    DIGESTS_SUFFIX,
+    DigestStore,
+    FileIndex,
+    cache_size_kib,
+)
+from cascade_backup_utils.index import INDEX_SUFFIX, IndexWriter
+from cascade_backup_utils.metrics import (
+    BYTES_PROCESSED,
+    CONSOLIDATE_SECONDS,
+    FILE_SECONDS,
+    FILES_CONSOLIDATED,
+)
+from cascade_backup_utils.rules import RULES_FILENAME, NoiseRules
+
+SECTION_SEPARATOR = "\n\n---\n\n"
+_SEPARATOR_BYTES = SECTION_SEPARATOR.encode("utf-8")
+
+# Number of files read ahead of the writer when a worker pool is used
+PREFETCH_DEPTH = 32
+
+# Line used to separate documents in clean_many()'s combined buffer
+_BATCH_SEPARATOR = "\x00"
+
+_TIMESTAMP_LINE = re.compile(r"(\*Backup created on: .*?\*)")
+
+_HEADER_TIMESTAMP = re.compile(
+    r"\*Backup created on: (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\*"
+)
+
+# Bytes read from the start of a file when looking for its header line
+HEADER_READ_SIZE = 4096
+
+logger = logging.getLogger(__name__)
+
+_UNIQUE_FILES = FILES_CONSOLIDATED.labels(result="unique")
+_DUPLICATE_FILES = FILES_CONSOLIDATED.labels(result="duplicate")
+_FAILED_FILES = FILES_CONSOLIDATED.labels(result="error")
+
+
+class ConversationRecord(NamedTuple):
+    """A cleaned backup as produced by BackupConsolidator.iter_conversations().
+
+    Attributes:
+        path: Path of the backup file.
+        timestamp: datetime the backup was created.
+        header: The "*Backup created on: ...*" line of the backup.
+        digest: SHA-256 hex digest of the cleaned text.
+        text: Cleaned conversation text without the header.
+    """
+
+    path: str
+    timestamp: datetime
+    header: str
+    digest: str
+    text: str
+
+    @property
+    def section(self):
+        """The record as it appears in the consolidated file."""
+        return f"{self.header}\n{self.text}"
+
+
+def _rebase_attachments(text, source_path, output_path):
+    """Rewrite a backup's attachment references for an output file elsewhere."""
+    source_dir = os.path.dirname(os.path.abspath(source_path))
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    if source_dir == output_dir:
+        return text
+    try:
+        prefix = os.path.relpath(source_dir, output_dir)
+    except ValueError:
+        # Different drives on Windows
+        prefix = source_dir
+    return rebase_references(text, prefix.replace(os.sep, "/"))
+
+
+def _replace_output(partial_file, output_file):
+    """Move a complete partial file and its index over the output file."""
+    # Index first: a reader rejects an index newer than its file
+    os.replace(partial_file + INDEX_SUFFIX, output_file + INDEX_SUFFIX)
+    os.replace(partial_file, output_file)
+
+
+class _SectionWriter:
+    """Write records to a consolidated file, separated by horizontal rules.
+
+    The file is written as UTF-8 bytes so that the offsets recorded in its
+    sidecar index (see the index module) are exact.
+    """
+
+    def __init__(self, path, written=0, atomic=False):
+        """Open for writing, or for appending if written sections already exist.
+
+        With atomic, a new file is written next to path and only replaces it
+        once the with block completes without an exception, so readers never
+        see a truncated file.
+        """
+        self.path = path
+        self.written = written
+        self.size = 0
+        self._output_path = None
+        if atomic:
+            self._output_path = path
+            self.path = path + PARTIAL_SUFFIX
+        self._file = None
+        self._index = None
+
+    def __enter__(self):
+        self._file = open(self.path, "ab" if self.written else "wb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        try:
+            self._index = IndexWriter(self.path + INDEX_SUFFIX, self.written)
+        except BaseException:
+            self._file.close()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self._output_path and exc_type is None:
+                self.sync()
+        finally:
+            self._file.close()
+            self._index.close(self.size)
+        if self._output_path:
+            if exc_type is None:
+                _replace_output(self.path, self._output_path)
+            else:
+                remove_file(self.path)
+                remove_file(self.path + INDEX_SUFFIX)
+
+    def write(self, record):
+        if self.written:
+            self._file.write(_SEPARATOR_BYTES)
+            self.size += len(_SEPARATOR_BYTES)
+        data = encode_text(record.section)
+        self._index.add(self.size, len(data), record.timestamp, record.digest)
+        self._file.write(data)
+        self.size += len(data)
+        self.written += 1
+
+    def sync(self):
+        """Flush the output and its index to disk and return its size in bytes."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._index.sync()
+        return self.size
+
+
+class _FileLists:
+    """Per-directory lists of backup files, the in-memory FileIndex."""
+
+    def __init__(self, consolidator, file_lists):
+        self._consolidator = consolidator
+        self.file_lists = file_lists
+
+    def __len__(self):
+        return sum(len(files) for files in self.file_lists)
+
+    def paths(self):
+        return itertools.chain.from_iterable(self.file_lists)
+
+    def iter_sorted(self):
+        return self._consolidator._merge_sorted_files(self.file_lists)
 
 
 class BackupConsolidator:
-    def __init__(self, backup_dir=None):
+    def __init__(
+        self,
+        backup_dir=None,
+        rules_file=None,
+        extra_dirs=None,
+        new_content_only=False,
+        key=None,
+        memory_limit=None,
+    ):
         """Initialize the consolidator.
 
         Args:
             backup_dir: Directory containing backup files.
                        If None, uses default location.
+            rules_file: JSON file with noise-pattern rules. If None, uses
+                       noise_rules.json in the backup directory when present,
+                       otherwise the built-in defaults.
+            extra_dirs: Additional backup directories to merge into the
+                       consolidated output, e.g. one per machine.
+            new_content_only: For delta-encoded backups, use only the lines
+                       added since the previous backup instead of the full
+                       reconstructed snapshot.
+            key: Key for encrypted (.md.enc) backups. If None, it is loaded
+                       from the environment when the first encrypted backup
+                       is read (see the encryption module).
+            memory_limit: Approximate memory ceiling in MiB for
+                       consolidate(). If set, file metadata and digests are
+                       kept on disk (see the external module) and
+                       timestamp_sources is not recorded.
         """
         if backup_dir is None:
             self.backup_dir = os.path.join(os.path.dirname(__file__), "backups")
@@ -30,20 +257,17 @@ class BackupConsolidator:
         self.consolidated_file = os.path.join(
             self.backup_dir, "consolidated_conversation.md"
         )
-        self.ui_messages = [
-            "DoneFeedback has been submitted",
-            "Start with History Ctrl+Enter",  # Fixed pattern
-            "Press Enter again to interrupt and send a new message",
-            "Image",
-            "Claude 3.5 Sonnet",
-            "Write",
-            "Chat",
-            "ChatWriteLegacy",
-            "Legacy",
-            "Changes overview (0 files need review)",
-            "GPT-4o",
-            "Cascade |  mode (Ctrl + .)",
-        ]
+        if rules_file is None:
+            rules_file = os.path.join(self.backup_dir, RULES_FILENAME)
+        self.noise_rules = NoiseRules(rules_file)
+        self.extra_dirs = list(extra_dirs or [])
+        self.new_content_only = new_content_only
+        self.key = key
+        self.memory_limit = memory_limit
+        # Minimum number of seconds between checkpoints in consolidate()
+        self.checkpoint_interval = DEFAULT_CHECKPOINT_INTERVAL
+        # How each file's timestamp was found: "filename", "header" or "mtime"
+        self.timestamp_sources = {}
 
     def clean_content(self, content):
         """Clean up the content by removing UI messages and duplicates.
@@ -56,7 +280,7 @@ class BackupConsolidator:
         """
         # First extract the timestamp if present
         timestamp_line = ""
-        match = re.search(r"(\*Backup created on: .*?\*)", content)
+        match = _TIMESTAMP_LINE.search(content)
         if match:
             timestamp_line = match.group(1) + "\n"
             content = content.replace(timestamp_line, "", 1)
@@ -65,8 +289,9 @@ class BackupConsolidator:
         lines = content.split("\n")
         cleaned = []
 
+        is_noise = self.noise_rules.matches
         for line in lines:
-            if any(msg in line for msg in self.ui_messages):
+            if is_noise(line):
                 continue
             if not line.strip():
                 continue
@@ -82,30 +307,77 @@ class BackupConsolidator:
 
         return result
 
-    def _get_backup_files(self):
-        """Get list of backup files in the backup directory."""
-        if not os.path.exists(self.backup_dir):
-            print(f"Backup directory not found: {self.backup_dir}")
-            return []
-
-        consolidated_name = "consolidated_conversation.md"
-        backup_dir = self.backup_dir
-        files = os.listdir(backup_dir)
+    def clean_many(self, documents):
+        """Clean many documents at once, with the same result as clean_content().
 
-        md_files = [f for f in files if f.endswith(".md")]
-        return [os.path.join(backup_dir, f) for f in md_files if f != consolidated_name]
-
-    def _extract_timestamp(self, filename):
-        """Extract timestamp from backup filename or content.
+        The documents are joined into one buffer so noise and blank lines are
+        removed with a few regex passes over it instead of a Python loop per
+        line, which is faster for bulk reprocessing of many small backups.
 
         Args:
-            filename: Path to the backup file.
+            documents: Iterable of raw content strings.
 
         Returns:
-            datetime object if valid timestamp found, None otherwise.
+            List of cleaned content strings, in input order.
         """
+        documents = list(documents)
+        if not documents:
+            return []
+        # Rules that can see past a line would match differently in the
+        # combined buffer
+        if not self.noise_rules.matcher.line_local or any(
+            _BATCH_SEPARATOR in doc for doc in documents
+        ):
+            return [self.clean_content(doc) for doc in documents]
+
+        timestamp_lines = []
+        bodies = []
+        for content in documents:
+            timestamp_line = ""
+            match = _TIMESTAMP_LINE.search(content)
+            if match:
+                timestamp_line = match.group(1) + "\n"
+                content = content.replace(timestamp_line, "", 1)
+            timestamp_lines.append(timestamp_line)
+            bodies.append(content)
+
+        buffer = f"\n{_BATCH_SEPARATOR}\n".join(bodies)
+        buffer = self.noise_rules.matcher.remove_lines(buffer)
+        results = buffer.split(_BATCH_SEPARATOR)
+
+        if len(results) != len(documents):
+            # A rule removed a separator line; fall back to the slow path
+            return [self.clean_content(doc) for doc in documents]
+
+        return [ts + result.strip() for ts, result in zip(timestamp_lines, results)]
+
+    def _iter_backup_files(self, backup_dir=None):
+        """Yield backup files in the backup directory without listing it whole."""
+        if backup_dir is None:
+            backup_dir = self.backup_dir
+        if not os.path.exists(backup_dir):
+            logger.warning("Backup directory not found: %s", backup_dir)
+            return
+
+        consolidated_name = "consolidated_conversation.md"
+        with os.scandir(backup_dir) as entries:
+            for entry in entries:
+                name = entry.name
+                if name == consolidated_name:
+                    continue
+                if name.endswith((".md", DELTA_SUFFIX, ENCRYPTED_SUFFIX)):
+                    yield os.path.join(backup_dir, name)
+
+    def _get_backup_files(self, backup_dir=None):
+        """Get list of backup files in the backup directory."""
+        return list(self._iter_backup_files(backup_dir))
+
+    def _timestamp_from_filename(self, filename):
+        """Parse a backup_YYYY-MM-DD_HH-MM-SS or backup_YYYYMMDD_HHMMSS name."""
+        name = os.path.basename(filename)
+
         # Try backup_YYYY-MM-DD_HH-MM-SS format
-        match = re.search(r"backup_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})", filename)
+        match = re.search(r"backup_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})", name)
         if match:
             timestamp_str = match.group(1)
             try:
@@ -114,7 +386,7 @@ class BackupConsolidator:
                 pass
 
         # Try backup_YYYYMMDD_HHMMSS format
-        match = re.search(r"backup_(\d{8}_\d{6})", filename)
+        match = re.search(r"backup_(\d{8}_\d{6})", name)
         if match:
             timestamp_str = match.group(1)
             try:
@@ -122,27 +394,132 @@ class BackupConsolidator:
             except ValueError:
                 pass
 
-        # Try to find timestamp in content
+        return None
+
+    def _timestamp_from_header(self, filename):
+        """Parse the "*Backup created on: ...*" line near the start of a file.
+
+        Only the first HEADER_READ_SIZE bytes are read, or for encrypted
+        backups the first encrypted chunk.
+        """
         try:
-            with open(filename, "r", encoding="utf-8") as f:
-                content = f.read()
-                match = re.search(
-                    r"\*Backup created on: (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\*",
-                    content,
-                )
-                if match:
-                    timestamp_str = match.group(1)
-                    try:
-                        return datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
-                    except ValueError:
-                        pass
+            if is_encrypted(filename):
+                head = read_encrypted_head(filename, self._get_key(), HEADER_READ_SIZE)
+            else:
+                with open(filename, "rb") as f:
+                    head = f.read(HEADER_READ_SIZE)
         except Exception:
-            pass
+            return None
+        head = decode_backup(head)
 
+        match = _HEADER_TIMESTAMP.search(head)
+        if match:
+            try:
+                return datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S")
+            except ValueError:
+                pass
         return None
 
+    def _timestamp_from_stat(self, filename):
+        """Use the file's modification time."""
+        try:
+            return datetime.fromtimestamp(os.stat(filename).st_mtime)
+        except OSError:
+            return None
+
+    def _find_timestamp(self, filename):
+        """Find a backup's timestamp and where it came from.
+
+        Sources are tried from cheapest to most expensive: the filename (no
+        I/O), the header line at the start of the file (bounded read), then
+        the modification time.
+
+        Returns:
+            (timestamp, source) tuple, source being "filename", "header" or
+            "mtime", or (None, None) if no valid timestamp is found.
+        """
+        for source, extract in (
+            ("filename", self._timestamp_from_filename),
+            ("header", self._timestamp_from_header),
+            ("mtime", self._timestamp_from_stat),
+        ):
+            timestamp = extract(filename)
+            if timestamp:
+                return timestamp, source
+        return None, None
+
+    def _extract_timestamp(self, filename):
+        """Extract timestamp from backup filename, header or file metadata.
+
+        See _find_timestamp(). The source used is recorded in
+        timestamp_sources, except in bounded-memory mode.
+
+        Args:
+            filename: Path to the backup file.
+
+        Returns:
+            datetime object if valid timestamp found, None otherwise.
+        """
+        timestamp, source = self._find_timestamp(filename)
+        if timestamp and self.memory_limit is None:
+            self.timestamp_sources[filename] = source
+        return timestamp
+
+    def rename_legacy_files(self, dry_run=False):
+        """Rename backups whose timestamp is not in their filename.
+
+        Files are renamed to backup_YYYYMMDD_HHMMSS (plus a numeric suffix on
+        collisions) using their header or modification time, so later runs
+        can order them from the filename alone.
+
+        Args:
+            dry_run: If True, only report what would be renamed.
+
+        Returns:
+            List of (old_path, new_path) tuples.
+        """
+        renamed = []
+        taken = set()
+        for file_path in sorted(self._get_backup_files()):
+            timestamp, source = self._find_timestamp(file_path)
+            if not timestamp or source == "filename":
+                continue
+
+            directory = os.path.dirname(file_path)
+            if is_delta(file_path):
+                extension = DELTA_SUFFIX
+            elif is_encrypted(file_path):
+                extension = ".md" + ENCRYPTED_SUFFIX
+            else:
+                extension = ".md"
+            stem = f"backup_{timestamp:%Y%m%d_%H%M%S}"
+            new_path = os.path.join(directory, stem + extension)
+            suffix = 1
+            while os.path.exists(new_path) or new_path in taken:
+                new_path = os.path.join(directory, f"{stem}_{suffix}{extension}")
+                suffix += 1
+            taken.add(new_path)
+
+            if dry_run:
+                logger.info("Would rename: %s -> %s", file_path, new_path)
+            else:
+                try:
+                    os.rename(file_path, new_path)
+                except OSError as e:
+                    logger.error("Error renaming %s: %s", file_path, e)
+                    continue
+                logger.info("Renamed: %s -> %s", file_path, new_path)
+            renamed.append((file_path, new_path))
+        return renamed
+
     def _sort_files_by_timestamp(self, files):
-        """Sort backup files by their timestamp."""
+        """Sort backup files by their timestamp.
+
+        Files without a valid timestamp are left out.
+
+        Returns:
+            List of (path, timestamp) tuples, oldest first.
+        """
         file_times = []
         for f in files:
             timestamp = self._extract_timestamp(f)
@@ -150,81 +527,434 @@ class BackupConsolidator:
                 file_times.append((f, timestamp))
 
         file_times.sort(key=lambda x: x[1])
-        return [f[0] for f in file_times]
+        return file_times
 
-    def consolidate(self):
-        """Consolidate all backup files into a single file."""
-        backup_files = self._get_backup_files()
-        if not backup_files:
-            print("No backup files found to consolidate.")
-            return
+    def _get_backup_file_lists(self):
+        """Get one list of backup files per backup directory."""
+        return [self._get_backup_files(d) for d in [self.backup_dir, *self.extra_dirs]]
 
-        # Sort files by timestamp and filter out those with invalid timestamps
-        valid_files = []
-        for file_path in backup_files:
-            timestamp = self._extract_timestamp(file_path)
-            if timestamp:
-                valid_files.append((file_path, timestamp))
+    def _merge_sorted_files(self, file_lists):
+        """Merge per-directory file lists into one timestamp-ordered stream.
 
-        if valid_files:
-            # Sort by timestamp
-            valid_files.sort(key=lambda x: x[1])
-            sorted_files = [f[0] for f in valid_files]
+        Each directory is sorted on its own and the sorted streams are
+        combined lazily with heapq.merge, so no combined list is built.
+
+        Yields:
+            (path, timestamp) tuples, oldest first.
+        """
+        streams = [self._sort_files_by_timestamp(files) for files in file_lists]
+        if len(streams) == 1:
+            return iter(streams[0])
+        return heapq.merge(*streams, key=lambda x: x[1])
+
+    def _get_key(self):
+        """Return the encryption key, loading it from the environment once."""
+        if self.key is None:
+            self.key = load_key()
+        return self.key
+
+    def _read_backup(self, file_path):
+        """Return the text of a backup file, reconstructing deltas.
+
+        Files are decoded by the encoding module, so a BOM, CRLF line endings
+        or invalid UTF-8 never cause a backup to be skipped.
+        """
+        if is_encrypted(file_path):
+            return read_encrypted(file_path, self._get_key())
+        if is_delta(file_path):
+            if self.new_content_only:
+                return read_added_text(file_path)
+            return read_snapshot(file_path)
+        return read_backup_file(file_path)
+
+    def _load_record(self, file_path, timestamp):
+        """Read and clean a single backup file.
+
+        Files without a backup header get one built from their timestamp.
+        Attachment references of backups outside the consolidated file's
+        directory are rewritten to stay valid from there.
+
+        Returns:
+            ConversationRecord for the file.
+        """
+        start = time.perf_counter()
+        content = self._read_backup(file_path).strip()
+
+        # Clean the content (excluding timestamp)
+        match = re.search(r"(\*Backup created on: .*?\*)(.*)", content, re.DOTALL)
+        if match:
+            header, body = match.group(1), match.group(2)
         else:
-            # If no valid timestamps found, use files in their original order
-            sorted_files = backup_files
+            header = f"*Backup created on: {timestamp:%Y-%m-%d %H:%M:%S}*"
+            body = content
 
-        consolidated_content = []
-        seen_content = set()
+        cleaned_content = self.clean_content(body)
+        digest = hashlib.sha256(encode_text(cleaned_content)).hexdigest()
+        cleaned_content = _rebase_attachments(
+            cleaned_content, file_path, self.consolidated_file
+        )
+        FILE_SECONDS.observe(time.perf_counter() - start)
+        BYTES_PROCESSED.inc(os.path.getsize(file_path))
+        return ConversationRecord(file_path, timestamp, header, digest, cleaned_content)
 
-        for file_path in sorted_files:
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    content = f.read().strip()
+    def _schedule_loads(self, sorted_files, executor=None):
+        """Pair each file with a callable returning its loaded record.
 
-                # Skip files with invalid timestamps
-                timestamp = self._extract_timestamp(file_path)
-                if not timestamp:
-                    continue
+        With an executor, up to PREFETCH_DEPTH files are read and cleaned on
+        the pool ahead of the consumer while keeping timestamp order.
 
-                # Clean the content (excluding timestamp)
-                match = re.search(
-                    r"(\*Backup created on: .*?\*)(.*)", content, re.DOTALL
+        Yields:
+            (path, load) tuples.
+        """
+        if executor is None:
+            for file_path, timestamp in sorted_files:
+                yield file_path, functools.partial(
+                    self._load_record, file_path, timestamp
                 )
-                if match:
-                    timestamp_line = match.group(1)
-                    content_without_timestamp = match.group(2)
-                    cleaned_content = self.clean_content(content_without_timestamp)
+            return
 
-                    # Skip if we've seen this content before
-                    if cleaned_content in seen_content:
-                        continue
+        pending = collections.deque()
+        for file_path, timestamp in sorted_files:
+            future = executor.submit(self._load_record, file_path, timestamp)
+            pending.append((file_path, future.result))
+            if len(pending) >= PREFETCH_DEPTH:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
 
-                    # Add back the timestamp
-                    cleaned = f"{timestamp_line}\n{cleaned_content}"
-                    consolidated_content.append(cleaned)
-                    seen_content.add(cleaned_content)
+    def _iter_records(self, file_lists, executor=None, seen_digests=None):
+        """Yield cleaned, de-duplicated records for the given files in order.
 
-            except Exception as e:
-                print(f"Error processing {file_path}: {str(e)}")
+        Digests of yielded records are added to seen_digests, which can be
+        passed in to skip content that was already consolidated.
+        """
+        return self._iter_sorted_records(
+            self._merge_sorted_files(file_lists), executor, seen_digests
+        )
+
+    def _iter_sorted_records(
+        self, sorted_files, executor=None, seen_digests=None, fingerprint=None
+    ):
+        """Yield cleaned, de-duplicated records for (path, timestamp) tuples.
 
-        if consolidated_content:
+        seen_digests can be any container supporting `in` and add(). Every
+        path processed, including duplicates and failures, is added to
+        fingerprint if given, so it covers exactly the files up to the
+        record just yielded.
+        """
+        self.noise_rules.reload_if_changed()
+        if seen_digests is None:
+            seen_digests = set()
+
+        # Checked once so quiet runs do no per-file formatting
+        debug = logger.isEnabledFor(logging.DEBUG)
+        for file_path, load in self._schedule_loads(sorted_files, executor):
+            if fingerprint is not None:
+                fingerprint.add(file_path)
             try:
-                with open(self.consolidated_file, "w", encoding="utf-8") as f:
-                    f.write("\n\n---\n\n".join(consolidated_content))
-                print(f"Consolidated file saved to: {self.consolidated_file}")
+                record = load()
             except Exception as e:
-                print(f"Error saving consolidated file: {str(e)}")
+                _FAILED_FILES.inc()
+                logger.warning("Error processing %s: %s", file_path, e)
+                continue
+
+            # Skip if we've seen this content before
+            if record.digest in seen_digests:
+                _DUPLICATE_FILES.inc()
+                if debug:
+                    logger.debug("Skipping duplicate content: %s", file_path)
+                continue
+
+            _UNIQUE_FILES.inc()
+            if debug:
+                logger.debug("Consolidating: %s", file_path)
+            seen_digests.add(record.digest)
+            yield record
+
+    def iter_conversations(self):
+        """Iterate over cleaned conversations in timestamp order.
+
+        Backups from the backup directory and any extra directories are
+        merged into a single timeline. Files are read one at a time and
+        duplicates are detected by digest, so memory use does not grow with
+        the size of the backups.
+
+        Yields:
+            ConversationRecord for each unique backup, oldest first.
+        """
+        return self._iter_records(self._get_backup_file_lists())
+
+    def export(self, output_path, fmt=None):
+        """Export cleaned conversations for analytics, one row per backup.
+
+        Args:
+            output_path: File to write.
+            fmt: "jsonl" or "parquet". If None, Parquet is used for paths
+                 ending in .parquet and JSON Lines otherwise.
+
+        Returns:
+            Number of rows written.
+        """
+        count = export_records(self.iter_conversations(), output_path, fmt)
+        logger.info("Exported %d conversations to: %s", count, output_path)
+        return count
+
+    def _load_checkpoint(self, checkpoint_file, partial_file, sources, index):
+        """Return the checkpoint of an interrupted run that can be resumed.
+
+        The backups sorting up to the last one the checkpoint covers must be
+        the same as when it was saved, and backups modified since must all
+        sort after it, otherwise the run starts over. The partial output is
+        truncated back to the checkpointed offset.
+
+        Returns:
+            (checkpoint, fingerprint, remaining) tuple, where fingerprint is
+            the PathFingerprint of the covered backups and remaining yields
+            the (path, timestamp) tuples after them, or None to start from
+            scratch.
+        """
+        if not os.path.exists(checkpoint_file):
+            return None
+        checkpoint = Checkpoint.load(checkpoint_file, sources)
+        if checkpoint is None:
+            return None
+        digests_file = self.consolidated_file + DIGESTS_SUFFIX
+        if checkpoint.digest_rows is not None and not os.path.exists(digests_file):
+            return None
+        try:
+            # Added backups may keep an old mtime (rsync -a, cp -p)
+            fingerprint = PathFingerprint()
+            remaining = index.iter_sorted()
+            for path, _ in remaining:
+                fingerprint.add(path)
+                if path == checkpoint.last_path:
+                    break
+            if fingerprint.value() != checkpoint.covered:
+                return None
+
+            saved_at = os.stat(checkpoint_file).st_mtime_ns
+            for path in index.paths():
+                if os.stat(path).st_mtime_ns <= saved_at:
+                    continue
+                timestamp = self._extract_timestamp(path)
+                if timestamp is None or timestamp <= checkpoint.last_timestamp:
+                    return None
+            if os.path.getsize(partial_file) < checkpoint.offset:
+                return None
+            os.truncate(partial_file, checkpoint.offset)
+        except OSError:
+            return None
+        return checkpoint, fingerprint, remaining
+
+    def _build_file_index(self):
+        """Index every backup file on disk, for bounded-memory mode.
+
+        The index is created next to the consolidated file rather than in
+        the system temporary directory, which may be in memory.
+        """
+        directory = os.path.dirname(os.path.abspath(self.consolidated_file))
+        if not os.path.isdir(directory):
+            directory = None
+        index = FileIndex(cache_size_kib(self.memory_limit), directory)
+        try:
+            for backup_dir in [self.backup_dir, *self.extra_dirs]:
+                for path in self._iter_backup_files(backup_dir):
+                    timestamp = self._extract_timestamp(path)
+                    if timestamp:
+                        index.add(path, timestamp)
+        except BaseException:
+            index.close()
+            raise
+        return index
+
+    def _open_digest_store(self, stack, checkpoint):
+        """Open the on-disk digest store, rolled back to the checkpoint.
+
+        The store is closed when stack exits and deleted by the caller once
+        consolidation is complete.
+        """
+        path = self.consolidated_file + DIGESTS_SUFFIX
+        if checkpoint.digest_rows is None:
+            remove_file(path)
+        store = DigestStore(path, cache_size_kib(self.memory_limit))
+        stack.callback(store.close)
+        if checkpoint.digest_rows is None:
+            checkpoint.digest_rows = 0
         else:
-            # Create an empty file even if no valid content found
-            try:
-                with open(self.consolidated_file, "w", encoding="utf-8") as f:
-                    f.write("")
-                print("No valid content found to consolidate.")
-            except Exception as e:
-                print(f"Error creating empty consolidated file: {str(e)}")
+            store.truncate(checkpoint.digest_rows)
+        return store
+
+    @CONSOLIDATE_SECONDS.time()
+    def consolidate(self, workers=None):
+        """Consolidate all backup files into a single file.
+
+        Output is written to a partial file that replaces the consolidated
+        file once complete. Progress is checkpointed at most every
+        checkpoint_interval seconds, and a run that was interrupted resumes
+        from its last checkpoint (see the checkpoint module).
+
+        With memory_limit set, the file list is sorted and duplicates are
+        detected on disk (see the external module).
+
+        Args:
+            workers: Number of threads reading, decrypting and cleaning
+                     backups ahead of the writer. If None, backups are read
+                     on the calling thread unless some are encrypted, in
+                     which case the ThreadPoolExecutor default is used.
+        """
+        bounded = self.memory_limit is not None
+        partial_file = self.consolidated_file + PARTIAL_SUFFIX
+        checkpoint_file = self.consolidated_file + CHECKPOINT_SUFFIX
+        digests_file = self.consolidated_file + DIGESTS_SUFFIX
+
+        try:
+            with ExitStack() as stack:
+                if bounded:
+                    index = stack.enter_context(self._build_file_index())
+                else:
+                    index = _FileLists(self, self._get_backup_file_lists())
+                if not len(index):
+                    logger.info("No backup files found to consolidate.")
+                    return
+
+                self.noise_rules.reload_if_changed()
+                sources = {
+                    "dirs": [self.backup_dir, *self.extra_dirs],
+                    "rules": self.noise_rules.matcher.digest,
+                    "bounded": bounded,
+                }
+                resumed = self._load_checkpoint(
+                    checkpoint_file, partial_file, sources, index
+                )
+                if resumed:
+                    checkpoint, fingerprint, sorted_files = resumed
+                    logger.info(
+                        "Resuming consolidation after: %s", checkpoint.last_path
+                    )
+                else:
+                    checkpoint = Checkpoint(sources)
+                    fingerprint = PathFingerprint()
+                    sorted_files = index.iter_sorted()
+
+                seen_digests = checkpoint.digests
+                if bounded:
+                    seen_digests = self._open_digest_store(stack, checkpoint)
+
+                parallel = workers is not None or any(
+                    is_encrypted(path) for path in index.paths()
+                )
+                executor = None
+                if parallel and workers != 1:
+                    executor = stack.enter_context(ThreadPoolExecutor(workers))
+
+                writer = stack.enter_context(
+                    _SectionWriter(partial_file, checkpoint.written)
+                )
+                records = self._iter_sorted_records(
+                    sorted_files, executor, seen_digests, fingerprint
+                )
+                last_saved = time.monotonic()
+                for record in records:
+                    writer.write(record)
+                    checkpoint.last_path = record.path
+                    checkpoint.last_timestamp = record.timestamp
+                    if time.monotonic() - last_saved >= self.checkpoint_interval:
+                        checkpoint.covered = fingerprint.value()
+                        checkpoint.offset = writer.sync()
+                        checkpoint.written = writer.written
+                        if bounded:
+                            checkpoint.digest_rows = seen_digests.commit()
+                        checkpoint.save(checkpoint_file)
+                        last_saved = time.monotonic()
+                writer.sync()
+            _replace_output(partial_file, self.consolidated_file)
+        except Exception as e:
+            logger.error("Error saving consolidated file: %s", e)
+            return
+        remove_file(checkpoint_file)
+        if bounded:
+            remove_file(digests_file)
+
+        if writer.written:
+            logger.info("Consolidated file saved to: %s", self.consolidated_file)
+        else:
+            logger.info("No valid content found to consolidate.")
+
+
+def _tag_records(tag, records):
+    for record in records:
+        yield tag, record
+
+
+@CONSOLIDATE_SECONDS.time()
+def consolidate_projects(backup_dirs, global_file=None, workers=None, key=None):
+    """Consolidate several backup directories in a single pass.
+
+    Each directory gets its own consolidated_conversation.md. Files from all
+    directories are read and cleaned on one shared thread pool, and the
+    compiled noise rules are shared between directories that use the same
+    rule set.
+
+    Args:
+        backup_dirs: Backup directories, typically one per project.
+        global_file: Optional path of a file that merges every project into
+                     one timeline, with duplicates removed across projects.
+        workers: Maximum number of worker threads. If None, uses the
+                 ThreadPoolExecutor default.
+        key: Key for encrypted backups. If None, it is loaded from the
+             environment when the first encrypted backup is read.
+
+    Returns:
+        Dict mapping each consolidated backup directory to the number of
+        sections written for it.
+    """
+    projects = []
+    for backup_dir in backup_dirs:
+        consolidator = BackupConsolidator(backup_dir, key=key)
+        file_lists = consolidator._get_backup_file_lists()
+        if any(file_lists):
+            projects.append((consolidator, file_lists))
+        else:
+            logger.info("No backup files found to consolidate in %s.", backup_dir)
+
+    if not projects:
+        return {}
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor, ExitStack() as stack:
+            writers = [
+                stack.enter_context(_SectionWriter(c.consolidated_file, atomic=True))
+                for c, _ in projects
+            ]
+            global_writer = None
+            if global_file:
+                global_writer = stack.enter_context(
+                    _SectionWriter(global_file, atomic=True)
+                )
+
+            streams = [
+                _tag_records(i, c._iter_records(file_lists, executor))
+                for i, (c, file_lists) in enumerate(projects)
+            ]
+            global_digests = set()
+            for i, record in heapq.merge(*streams, key=lambda x: x[1].timestamp):
+                writers[i].write(record)
+                if global_writer and record.digest not in global_digests:
+                    global_digests.add(record.digest)
+                    text = _rebase_attachments(record.text, record.path, global_file)
+                    global_writer.write(record._replace(text=text))
+    except Exception as e:
+        logger.error("Error saving consolidated files: %s", e)
+        return {}
+
+    for (consolidator, _), writer in zip(projects, writers):
+        logger.info("Consolidated file saved to: %s", consolidator.consolidated_file)
+    if global_writer:
+        logger.info("Global consolidated file saved to: %s", global_file)
+    return {c.backup_dir: w.written for (c, _), w in zip(projects, writers)}
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     consolidator = BackupConsolidator()
     consolidator.consolidate()
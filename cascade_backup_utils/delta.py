@@ -0,0 +1,257 @@
+"""Module for delta-encoded backup snapshots.
+
+Successive backups of a conversation share almost all of their text. Instead
+of a full copy, a backup can be stored as a line-level delta against the most
+recent backup, with a full "keyframe" written periodically so that
+reconstructing a snapshot never has to follow a long chain of deltas.
+
+Delta files keep the backup's "*Backup created on: ...*" line as their first
+line, so timestamps can still be read without reconstruction. The rest of the
+file is a small list of operations on the base snapshot's body::
+
+    *Backup created on: 2025-02-10 00:10:59*
+    %cascade-delta base=backup_20250209_200618.md chain=1
+    =0,120
+    +2
+    a new line
+    another new line
+
+"=start,count" copies lines from the base body and "+n" inserts the n lines
+that follow it.
+"""
+
+import difflib
+import os
+import re
+
+from cascade_backup_utils.encoding import normalize_newlines, read_backup_file
+
+DELTA_SUFFIX = ".delta"
+DELTA_MARKER = "%cascade-delta"
+
+# Keep at most this many deltas between full snapshots
+DEFAULT_KEYFRAME_INTERVAL = 10
+
+_BACKUP_NAME = re.compile(r"^backup_\d{8}_\d{6}.*\.(md|delta)$")
+_DELTA_HEADER = re.compile(rf"^{DELTA_MARKER} base=(\S+) chain=(\d+)$")
+
+
+class DeltaError(Exception):
+    """Raised when a delta file is malformed or its base is missing."""
+
+
+def is_delta(path):
+    """Return True if the path names a delta-encoded backup."""
+    return path.endswith(DELTA_SUFFIX)
+
+
+def _split_header(text):
+    header, _, body = text.partition("\n")
+    return header, body
+
+
+def make_delta(base_body, new_body):
+    """Compute the operations turning base_body into new_body.
+
+    Returns:
+        Tuple of (ops, inserted) where ops is a list of ("=", start, count)
+        and ("+", lines) tuples and inserted is the number of inserted lines.
+    """
+    base_lines = base_body.split("\n")
+    new_lines = new_body.split("\n")
+    matcher = difflib.SequenceMatcher(None, base_lines, new_lines)
+
+    ops = []
+    inserted = 0
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(("=", i1, i2 - i1))
+        elif tag in ("replace", "insert"):
+            ops.append(("+", new_lines[j1:j2]))
+            inserted += j2 - j1
+    return ops, inserted
+
+
+def apply_delta(base_body, ops):
+    """Rebuild a body from its base body and delta operations."""
+    base_lines = base_body.split("\n")
+    lines = []
+    for op in ops:
+        if op[0] == "=":
+            lines.extend(base_lines[op[1] : op[1] + op[2]])
+        else:
+            lines.extend(op[1])
+    return "\n".join(lines)
+
+
+def format_delta(header, base_name, chain, ops):
+    """Serialize a delta to the on-disk text format."""
+    out = [header, f"{DELTA_MARKER} base={base_name} chain={chain}"]
+    for op in ops:
+        if op[0] == "=":
+            out.append(f"={op[1]},{op[2]}")
+        else:
+            out.append(f"+{len(op[1])}")
+            out.extend(op[1])
+    return "\n".join(out)
+
+
+def parse_delta(text):
+    """Parse the on-disk delta format.
+
+    Returns:
+        Tuple of (header, base_name, chain, ops).
+
+    Raises:
+        DeltaError: If the text is not a valid delta.
+    """
+    lines = text.split("\n")
+    if len(lines) < 2:
+        raise DeltaError("Delta is missing its header")
+    match = _DELTA_HEADER.match(lines[1])
+    if not match:
+        raise DeltaError("Delta is missing its header")
+
+    ops = []
+    i = 2
+    try:
+        while i < len(lines):
+            line = lines[i]
+            if line.startswith("="):
+                start, count = line[1:].split(",")
+                ops.append(("=", int(start), int(count)))
+                i += 1
+            elif line.startswith("+"):
+                count = int(line[1:])
+                if i + 1 + count > len(lines):
+                    raise DeltaError("Delta is truncated")
+                ops.append(("+", lines[i + 1 : i + 1 + count]))
+                i += 1 + count
+            else:
+                raise DeltaError(f"Invalid delta operation: {line!r}")
+    except ValueError as e:
+        raise DeltaError(f"Invalid delta operation: {str(e)}") from e
+
+    return lines[0], match.group(1), int(match.group(2)), ops
+
+
+def _read_delta_header(path):
+    """Read only the first two lines of a delta file.
+
+    Returns:
+        Tuple of (base_name, chain).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        f.readline()
+        match = _DELTA_HEADER.match(f.readline().rstrip("\n"))
+    if not match:
+        raise DeltaError(f"{path} is not a delta backup")
+    return match.group(1), int(match.group(2))
+
+
+def chain_length(path):
+    """Number of deltas between a backup and its keyframe (0 for full files)."""
+    if not is_delta(path):
+        return 0
+    return _read_delta_header(path)[1]
+
+
+def base_paths(path):
+    """Return the paths a delta backup depends on, nearest first."""
+    bases = []
+    while is_delta(path):
+        base_name, _ = _read_delta_header(path)
+        path = os.path.join(os.path.dirname(path), base_name)
+        bases.append(path)
+    return bases
+
+
+def read_snapshot(path, max_chain=1000):
+    """Reconstruct the full text of a backup, following delta chains.
+
+    Args:
+        path: Path to a full (.md) or delta backup.
+        max_chain: Safety limit on the number of deltas followed.
+
+    Returns:
+        The snapshot text as it would have been written without deltas.
+
+    Raises:
+        DeltaError: If a delta is malformed, a base is missing or the chain
+                    is longer than max_chain.
+    """
+    deltas = []
+    while is_delta(path):
+        if len(deltas) >= max_chain:
+            raise DeltaError(f"Delta chain for {path} exceeds {max_chain} entries")
+        header, base_name, _, ops = parse_delta(read_backup_file(path))
+        deltas.append((header, ops))
+        path = os.path.join(os.path.dirname(path), base_name)
+        if not os.path.exists(path):
+            raise DeltaError(f"Base backup {base_name} is missing")
+
+    text = read_backup_file(path)
+
+    for header, ops in reversed(deltas):
+        _, body = _split_header(text)
+        text = f"{header}\n{apply_delta(body, ops)}"
+    return text
+
+
+def read_added_text(path):
+    """Return a delta backup's header and inserted lines, without its base.
+
+    This is the content that is new in the snapshot compared to the backup
+    before it, obtained without reconstructing either one.
+    """
+    header, _, _, ops = parse_delta(read_backup_file(path))
+    added = [line for op in ops if op[0] == "+" for line in op[1]]
+    return "\n".join([header, *added])
+
+
+def latest_backup(backup_dir):
+    """Return the path of the most recent backup written by CascadeBackup."""
+    names = [n for n in os.listdir(backup_dir) if _BACKUP_NAME.match(n)]
+    if not names:
+        return None
+    return os.path.join(backup_dir, max(names))
+
+
+def write_snapshot(backup_dir, stem, text, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+    """Write a backup as a delta against the latest backup when worthwhile.
+
+    A full snapshot is written instead when there is no previous backup,
+    the chain would reach keyframe_interval, or more than half of the new
+    lines differ from the previous backup (likely a different conversation).
+
+    Args:
+        backup_dir: Directory to write to.
+        stem: File name without extension, e.g. "backup_20250210_001059".
+        text: Full snapshot text, starting with its header line.
+        keyframe_interval: Maximum distance from a full snapshot.
+
+    Returns:
+        Path of the written file.
+    """
+    # Backups are read back with LF line endings: a CR left in an inserted
+    # line would split it in two and break the delta's line counts
+    text = normalize_newlines(text)
+    base_path = latest_backup(backup_dir)
+    if base_path is not None:
+        chain = chain_length(base_path) + 1
+        if chain < keyframe_interval:
+            _, base_body = _split_header(read_snapshot(base_path))
+            header, body = _split_header(text)
+            ops, inserted = make_delta(base_body, body)
+            if inserted * 2 <= len(body.split("\n")):
+                path = os.path.join(backup_dir, stem + DELTA_SUFFIX)
+                with open(path, "w", encoding="utf-8", newline="\n") as f:
+                    f.write(
+                        format_delta(header, os.path.basename(base_path), chain, ops)
+                    )
+                return path
+
+    path = os.path.join(backup_dir, stem + ".md")
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        f.write(text)
+    return path
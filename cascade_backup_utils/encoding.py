@@ -0,0 +1,62 @@
+"""Module for decoding backup files.
+
+Backups are read as bytes and decoded in one step instead of through a text
+mode file, so every reader (plain, delta and encrypted backups) treats them
+the same way whatever produced them:
+- a UTF-8 byte order mark is dropped, and files starting with a UTF-16 one
+  (e.g. saved as "Unicode" by Windows Notepad) are decoded as UTF-16
+- CRLF and lone CR line endings become LF
+- bytes that are not valid UTF-8 are kept as lone surrogates
+  ("surrogateescape") instead of failing the whole file; encode_text() turns
+  them back into the original bytes when the text is written out
+
+Text handed to strict UTF-8 consumers (JSON Lines, Parquet, HTTP responses,
+the terminal) goes through replace_undecodable(), which replaces such bytes
+with U+FFFD.
+"""
+
+import codecs
+import io
+
+_UTF16_BOMS = (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+
+
+def decode_backup(data):
+    """Decode the bytes of a backup file to text with LF line endings."""
+    encoding, errors = "utf-8", "surrogateescape"
+    if data.startswith(_UTF16_BOMS):
+        # The utf-16 codec consumes the BOM and picks the byte order from it
+        encoding, errors = "utf-16", "replace"
+    elif data.startswith(codecs.BOM_UTF8):
+        data = data[len(codecs.BOM_UTF8) :]
+    if b"\r" not in data:
+        return data.decode(encoding, errors)
+    # Universal newlines, translated while decoding as in text mode
+    return io.TextIOWrapper(io.BytesIO(data), encoding, errors).read()
+
+
+def normalize_newlines(text):
+    """Turn CRLF and lone CR line endings into LF, as decode_backup() does."""
+    if "\r" not in text:
+        return text
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def read_backup_file(path):
+    """Read and decode a backup file (see decode_backup())."""
+    with open(path, "rb") as f:
+        return decode_backup(f.read())
+
+
+def encode_text(text):
+    """Encode text as UTF-8, restoring bytes kept by decode_backup()."""
+    return text.encode("utf-8", "surrogateescape")
+
+
+def replace_undecodable(text):
+    """Replace bytes kept by decode_backup() with U+FFFD."""
+    try:
+        text.encode("utf-8")
+    except UnicodeEncodeError:
+        return encode_text(text).decode("utf-8", "replace")
+    return text
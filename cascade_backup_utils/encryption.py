@@ -0,0 +1,212 @@
+"""Module for encrypted-at-rest backups.
+
+Encrypted backups are named like plaintext ones with an extra ".enc" suffix
+(backup_20250210_001059.md.enc) and use chunked AES-256-GCM, so a file can be
+decrypted chunk by chunk without holding the ciphertext in memory and any
+tampering, reordering or truncation is detected.
+
+File layout::
+
+    magic (8 bytes) | chunk size (4 bytes) | nonce prefix (7 bytes)
+    chunk 0 ciphertext + tag | chunk 1 ciphertext + tag | ...
+
+Each chunk's nonce is the random nonce prefix, a 4-byte chunk counter and a
+final-chunk flag, and the file header is authenticated with every chunk.
+
+The key is 32 random bytes, stored URL-safe base64 encoded. It is read from
+the CASCADE_BACKUP_KEY environment variable or from a keyfile, either given
+explicitly or named by CASCADE_BACKUP_KEYFILE.
+
+Requires the optional cryptography package:
+pip install cascade-backup-utils[encryption]
+"""
+
+import base64
+import binascii
+import os
+import struct
+
+from cascade_backup_utils.encoding import decode_backup
+
+ENCRYPTED_SUFFIX = ".enc"
+
+KEY_ENV_VAR = "CASCADE_BACKUP_KEY"
+KEYFILE_ENV_VAR = "CASCADE_BACKUP_KEYFILE"
+
+KEY_SIZE = 32
+DEFAULT_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+
+_MAGIC = b"CBUENC\x00\x01"
+_HEADER = struct.Struct(">8sI7s")
+_TAG_SIZE = 16
+
+
+class EncryptionError(Exception):
+    """Raised when a key is missing or invalid or a file fails to decrypt."""
+
+
+def is_encrypted(path):
+    """Return True if the path names an encrypted backup."""
+    return path.endswith(ENCRYPTED_SUFFIX)
+
+
+def _aesgcm(key):
+    try:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    except ImportError as e:
+        raise ImportError(
+            "Encrypted backups require cryptography: "
+            "pip install cascade-backup-utils[encryption]"
+        ) from e
+    return AESGCM(key)
+
+
+def _nonce(prefix, counter, last):
+    return prefix + struct.pack(">I?", counter, last)
+
+
+def generate_key():
+    """Return a new random key, URL-safe base64 encoded."""
+    return base64.urlsafe_b64encode(os.urandom(KEY_SIZE)).decode("ascii")
+
+
+def decode_key(encoded):
+    """Decode a base64 key as produced by generate_key().
+
+    Raises:
+        EncryptionError: If the key is not valid.
+    """
+    try:
+        key = base64.urlsafe_b64decode(encoded.strip().encode("ascii"))
+    except (ValueError, binascii.Error) as e:
+        raise EncryptionError(f"Invalid encryption key: {str(e)}") from e
+    if len(key) != KEY_SIZE:
+        raise EncryptionError(f"Invalid encryption key: expected {KEY_SIZE} bytes")
+    return key
+
+
+def load_key(keyfile=None):
+    """Load the encryption key.
+
+    Args:
+        keyfile: Path of a file containing the key. If None, the key is
+                 taken from CASCADE_BACKUP_KEY or the file named by
+                 CASCADE_BACKUP_KEYFILE.
+
+    Returns:
+        The raw key bytes.
+
+    Raises:
+        EncryptionError: If no key is configured or it is invalid.
+    """
+    if keyfile is None:
+        if os.environ.get(KEY_ENV_VAR):
+            return decode_key(os.environ[KEY_ENV_VAR])
+        keyfile = os.environ.get(KEYFILE_ENV_VAR)
+    if not keyfile:
+        raise EncryptionError(
+            f"No encryption key: set {KEY_ENV_VAR} or {KEYFILE_ENV_VAR}"
+        )
+    try:
+        with open(os.path.expanduser(keyfile), "r", encoding="ascii") as f:
+            return decode_key(f.read())
+    except (OSError, UnicodeDecodeError) as e:
+        raise EncryptionError(f"Cannot read keyfile {keyfile}: {str(e)}") from e
+
+
+def write_keyfile(path):
+    """Write a new key to path, readable only by the current user.
+
+    Raises:
+        FileExistsError: If path already exists.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w", encoding="ascii") as f:
+        f.write(generate_key() + "\n")
+
+
+def write_encrypted(path, text, key, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Encrypt text and write it to path."""
+    aead = _aesgcm(key)
+    prefix = os.urandom(7)
+    header = _HEADER.pack(_MAGIC, chunk_size, prefix)
+    data = text.encode("utf-8")
+
+    with open(path, "wb") as f:
+        f.write(header)
+        starts = range(0, len(data), chunk_size) or [0]
+        for counter, start in enumerate(starts):
+            last = start + chunk_size >= len(data)
+            chunk = data[start : start + chunk_size]
+            f.write(aead.encrypt(_nonce(prefix, counter, last), chunk, header))
+
+
+def _read_header(f):
+    header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        raise EncryptionError("Not an encrypted backup")
+    magic, chunk_size, prefix = _HEADER.unpack(header)
+    if magic != _MAGIC or not 0 < chunk_size <= MAX_CHUNK_SIZE:
+        raise EncryptionError("Not an encrypted backup")
+    return header, chunk_size, prefix
+
+
+def _decrypt_chunk(aead, header, prefix, counter, last, block):
+    from cryptography.exceptions import InvalidTag
+
+    if len(block) < _TAG_SIZE:
+        raise EncryptionError("Encrypted backup is truncated")
+    try:
+        return aead.decrypt(_nonce(prefix, counter, last), block, header)
+    except InvalidTag:
+        raise EncryptionError(
+            "Decryption failed: wrong key or corrupted backup"
+        ) from None
+
+
+def iter_decrypted(f, key):
+    """Decrypt an open binary file chunk by chunk.
+
+    Yields:
+        Plaintext bytes of each chunk, in order.
+
+    Raises:
+        EncryptionError: If the file is not an encrypted backup, the key is
+                         wrong, or the file was modified or truncated.
+    """
+    header, chunk_size, prefix = _read_header(f)
+    aead = _aesgcm(key)
+    block_size = chunk_size + _TAG_SIZE
+    block = f.read(block_size)
+    counter = 0
+    while True:
+        next_block = f.read(block_size)
+        last = not next_block
+        yield _decrypt_chunk(aead, header, prefix, counter, last, block)
+        if last:
+            return
+        block = next_block
+        counter += 1
+
+
+def read_encrypted(path, key):
+    """Decrypt an encrypted backup and return its text.
+
+    The plaintext is decoded like any other backup (see the encoding module).
+    """
+    with open(path, "rb") as f:
+        return decode_backup(b"".join(iter_decrypted(f, key)))
+
+
+def read_encrypted_head(path, key, size):
+    """Return up to size bytes from the start of an encrypted backup.
+
+    Only the first chunk is decrypted and authenticated.
+    """
+    with open(path, "rb") as f:
+        header, chunk_size, prefix = _read_header(f)
+        block = f.read(chunk_size + _TAG_SIZE)
+        last = not f.read(1)
+    chunk = _decrypt_chunk(_aesgcm(key), header, prefix, 0, last, block)
+    return chunk[:size]
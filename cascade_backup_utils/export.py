@@ -0,0 +1,114 @@
+"""Module for exporting consolidated conversations for analytics.
+
+Records from BackupConsolidator.iter_conversations() are written one row per
+backup, either as JSON Lines (standard library only) or as Parquet when
+pyarrow is installed. Both writers stream, so memory use is bounded by a
+single row or row group.
+
+Row fields:
+- path: path of the backup file
+- timestamp: ISO 8601 creation time of the backup
+- digest: SHA-256 hex digest of the cleaned text
+- byte_length: length of the cleaned text in UTF-8 bytes
+- text: cleaned conversation text, with bytes that are not valid UTF-8
+  replaced by U+FFFD
+"""
+
+import json
+
+from cascade_backup_utils.encoding import encode_text, replace_undecodable
+
+DEFAULT_ROW_GROUP_SIZE = 10000
+
+EXPORT_FORMATS = ("jsonl", "parquet")
+
+
+def record_to_row(record):
+    """Convert a ConversationRecord into an export row."""
+    return {
+        "path": record.path,
+        "timestamp": record.timestamp.isoformat(),
+        "digest": record.digest,
+        "byte_length": len(encode_text(record.text)),
+        "text": replace_undecodable(record.text),
+    }
+
+
+def export_jsonl(records, output_path):
+    """Write records as JSON Lines.
+
+    Returns:
+        Number of rows written.
+    """
+    count = 0
+    with open(output_path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record_to_row(record), ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def export_parquet(records, output_path, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """Write records as Parquet, one row group per row_group_size records.
+
+    Returns:
+        Number of rows written.
+
+    Raises:
+        ImportError: If pyarrow is not installed.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "Parquet export requires pyarrow: pip install cascade-backup-utils[parquet]"
+        ) from e
+
+    schema = pa.schema(
+        [
+            ("path", pa.string()),
+            ("timestamp", pa.timestamp("us")),
+            ("digest", pa.string()),
+            ("byte_length", pa.int64()),
+            ("text", pa.large_string()),
+        ]
+    )
+
+    columns = {name: [] for name in schema.names}
+    count = 0
+
+    def flush(writer):
+        writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+        for values in columns.values():
+            values.clear()
+
+    with pq.ParquetWriter(output_path, schema) as writer:
+        for record in records:
+            columns["path"].append(record.path)
+            columns["timestamp"].append(record.timestamp)
+            columns["digest"].append(record.digest)
+            columns["byte_length"].append(len(encode_text(record.text)))
+            columns["text"].append(replace_undecodable(record.text))
+            count += 1
+            if count % row_group_size == 0:
+                flush(writer)
+        if count % row_group_size or count == 0:
+            flush(writer)
+    return count
+
+
+def export_records(records, output_path, fmt=None):
+    """Export records in the given format, inferred from the extension if None.
+
+    Raises:
+        ValueError: If the format is not supported.
+    """
+    if fmt is None:
+        fmt = "parquet" if output_path.endswith(".parquet") else "jsonl"
+    if fmt == "jsonl":
+        return export_jsonl(records, output_path)
+    if fmt == "parquet":
+        return export_parquet(records, output_path)
+    raise ValueError(f"Unsupported export format: {fmt}")
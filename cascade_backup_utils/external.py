@@ -0,0 +1,168 @@
+"""Module for consolidating archives larger than memory.
+
+With a memory limit set, BackupConsolidator.consolidate() keeps its
+per-file state in SQLite databases instead of Python lists and sets:
+- FileIndex: backup paths and timestamps in a temporary table, ordered with
+  SQLite's external merge sort, which spills to temporary files
+- DigestStore: digests of consolidated sections, next to the output so an
+  interrupted run can be resumed
+
+Each database gets a quarter of the limit for its page cache. The rest
+covers the backups being read and cleaned, so memory use does not grow
+with the number of backups, only with the size of the largest ones.
+"""
+
+import os
+import sqlite3
+import tempfile
+from datetime import datetime
+
+DIGESTS_SUFFIX = ".digests"
+
+# Fixed-width timestamps sort correctly as text
+_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+# Rows buffered before each insert into the file index
+_INSERT_BATCH = 1000
+
+
+def cache_size_kib(memory_limit):
+    """Page cache size in KiB for each database under a limit in MiB."""
+    return max(256, int(memory_limit * 1024) // 4)
+
+
+def _connect(path, cache_kib):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute(f"PRAGMA cache_size = -{int(cache_kib)}")
+    conn.execute("PRAGMA temp_store = FILE")
+    return conn
+
+
+class FileIndex:
+    """Backup paths and timestamps, sorted on disk."""
+
+    def __init__(self, cache_kib, directory=None):
+        """Create an empty index in a temporary file.
+
+        Args:
+            cache_kib: SQLite page cache size in KiB.
+            directory: Where to create the temporary file. If None, uses the
+                       system temporary directory.
+        """
+        fd, self.path = tempfile.mkstemp(suffix=".sqlite", dir=directory)
+        os.close(fd)
+        self._conn = _connect(self.path, cache_kib)
+        # The index is rebuilt from scratch by every run
+        self._conn.execute("PRAGMA journal_mode = OFF")
+        self._conn.execute("PRAGMA synchronous = OFF")
+        self._conn.execute("CREATE TABLE files (timestamp TEXT, path TEXT)")
+        self._pending = []
+        self._count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def add(self, path, timestamp):
+        """Add a backup file with its timestamp."""
+        self._pending.append((timestamp.strftime(_TIMESTAMP_FORMAT), path))
+        self._count += 1
+        if len(self._pending) >= _INSERT_BATCH:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self._conn.executemany("INSERT INTO files VALUES (?, ?)", self._pending)
+            self._pending = []
+
+    def paths(self):
+        """Yield every path in insertion order."""
+        self._flush()
+        for (path,) in self._conn.execute("SELECT path FROM files ORDER BY rowid"):
+            yield path
+
+    def iter_sorted(self):
+        """Yield (path, timestamp) tuples, oldest first.
+
+        Files with equal timestamps keep their insertion order.
+        """
+        self._flush()
+        query = "SELECT path, timestamp FROM files ORDER BY timestamp, rowid"
+        for path, timestamp in self._conn.execute(query):
+            yield path, datetime.strptime(timestamp, _TIMESTAMP_FORMAT)
+
+    def close(self):
+        """Close and delete the index."""
+        self._conn.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class DigestStore:
+    """Set of section digests in a SQLite table.
+
+    Supports the `in` and add() operations of the set it replaces. Changes
+    are only durable after commit(), and truncate() discards digests added
+    after a given commit so the store can be rolled back to a checkpoint.
+    """
+
+    def __init__(self, path, cache_kib):
+        """Open or create the store at path.
+
+        Args:
+            path: Database file.
+            cache_kib: SQLite page cache size in KiB.
+        """
+        self.path = path
+        self._conn = _connect(path, cache_kib)
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS digests "
+            "(id INTEGER PRIMARY KEY, digest BLOB UNIQUE)"
+        )
+        self._conn.execute("BEGIN")
+
+    def __contains__(self, digest):
+        cursor = self._conn.execute(
+            "SELECT 1 FROM digests WHERE digest = ?", (bytes.fromhex(digest),)
+        )
+        return cursor.fetchone() is not None
+
+    def add(self, digest):
+        """Add a hex digest."""
+        self._conn.execute(
+            "INSERT OR IGNORE INTO digests (digest) VALUES (?)",
+            (bytes.fromhex(digest),),
+        )
+
+    def commit(self):
+        """Make added digests durable.
+
+        Returns:
+            Number of rows to pass to truncate() to return to this state.
+        """
+        self._conn.execute("COMMIT")
+        self._conn.execute("BEGIN")
+        query = "SELECT COALESCE(MAX(id), 0) FROM digests"
+        (rows,) = self._conn.execute(query).fetchone()
+        return rows
+
+    def truncate(self, rows):
+        """Discard digests added after the commit that returned rows."""
+        self._conn.execute("DELETE FROM digests WHERE id > ?", (rows,))
+
+    def close(self, remove=False):
+        """Close the store, deleting its file if remove is True."""
+        self._conn.close()
+        if remove:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
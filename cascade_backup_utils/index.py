@@ -0,0 +1,188 @@
+"""Module for random access to consolidated files.
+
+Every consolidated file gets a sidecar index (consolidated_conversation.md.idx)
+with one fixed-width entry per section, in file order::
+
+    header:  magic (8 bytes) | size of the consolidated file (8 bytes)
+    entry:   offset (8) | length (8) | timestamp (8) | SHA-256 digest (32)
+
+Offsets and lengths are in bytes, timestamps in microseconds since
+1970-01-01 (naive, like the backup headers). Sections are written oldest
+first, so ConsolidatedReader can binary search the memory-mapped index by
+timestamp and slice the section straight out of the memory-mapped file,
+without reading either file in full.
+"""
+
+import mmap
+import os
+import struct
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+INDEX_SUFFIX = ".idx"
+
+_MAGIC = b"CBUIDX\x00\x01"
+_HEADER = struct.Struct(">8sQ")
+_ENTRY = struct.Struct(">QQq32s")
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class SectionIndexError(Exception):
+    """Raised when an index is malformed or does not match its file."""
+
+
+class IndexEntry(NamedTuple):
+    """Location of one section of a consolidated file."""
+
+    offset: int
+    length: int
+    timestamp: datetime
+    digest: str
+
+
+class IndexWriter:
+    """Append entries to a consolidated file's index."""
+
+    def __init__(self, path, entries=0):
+        """Open the index at path, keeping its first `entries` entries.
+
+        Args:
+            path: Index file.
+            entries: Number of existing entries to keep, for appending to a
+                     consolidated file that already has that many sections.
+        """
+        self.path = path
+        if entries and os.path.exists(path):
+            self._file = open(path, "r+b")
+            self._file.truncate(_HEADER.size + entries * _ENTRY.size)
+            self._file.seek(0, os.SEEK_END)
+        else:
+            self._file = open(path, "wb")
+            self._file.write(_HEADER.pack(_MAGIC, 0))
+
+    def add(self, offset, length, timestamp, digest):
+        """Add the entry of the next section."""
+        micros = (timestamp - _EPOCH) // _MICROSECOND
+        self._file.write(_ENTRY.pack(offset, length, micros, bytes.fromhex(digest)))
+
+    def sync(self):
+        """Flush the index to disk."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self, data_size):
+        """Record the size of the consolidated file and close the index."""
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(_MAGIC, data_size))
+        self._file.close()
+
+
+def _map(f):
+    if os.fstat(f.fileno()).st_size == 0:
+        return b""
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class ConsolidatedReader:
+    """Look up sections of a consolidated file through its index.
+
+    Lookups by position or timestamp read one index entry per binary search
+    step and then only the bytes of the section, so they take O(log n) time
+    regardless of the file size.
+    """
+
+    def __init__(self, path):
+        """Open a consolidated file and its index.
+
+        Raises:
+            FileNotFoundError: If the file or its index does not exist.
+            SectionIndexError: If the index is malformed or out of date.
+        """
+        self.path = path
+        self._data_file = self._index_file = None
+        self._data = self._index = b""
+        try:
+            self._data_file = open(path, "rb")
+            self._index_file = open(path + INDEX_SUFFIX, "rb")
+            self._data = _map(self._data_file)
+            self._index = _map(self._index_file)
+            self._check()
+        except Exception:
+            self.close()
+            raise
+
+    def _check(self):
+        if len(self._index) < _HEADER.size:
+            raise SectionIndexError(f"Index of {self.path} is truncated")
+        magic, data_size = _HEADER.unpack_from(self._index, 0)
+        if magic != _MAGIC:
+            raise SectionIndexError(f"Index of {self.path} is not a section index")
+        if (len(self._index) - _HEADER.size) % _ENTRY.size:
+            raise SectionIndexError(f"Index of {self.path} is truncated")
+        if data_size != len(self._data):
+            raise SectionIndexError(
+                f"Index of {self.path} is out of date; consolidate again"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return (len(self._index) - _HEADER.size) // _ENTRY.size
+
+    def _timestamp_micros(self, i):
+        return _ENTRY.unpack_from(self._index, _HEADER.size + i * _ENTRY.size)[2]
+
+    def entry(self, i):
+        """Return the IndexEntry of the i-th section."""
+        if not 0 <= i < len(self):
+            raise IndexError("section index out of range")
+        offset, length, micros, digest = _ENTRY.unpack_from(
+            self._index, _HEADER.size + i * _ENTRY.size
+        )
+        timestamp = _EPOCH + timedelta(microseconds=micros)
+        return IndexEntry(offset, length, timestamp, digest.hex())
+
+    def section(self, i):
+        """Return the text of the i-th section.
+
+        Bytes that are not valid UTF-8 are decoded as lone surrogates, as
+        they were when the backup was read (see the encoding module).
+        """
+        entry = self.entry(i)
+        data = self._data[entry.offset : entry.offset + entry.length]
+        return data.decode("utf-8", "surrogateescape")
+
+    def find(self, timestamp):
+        """Return the position of the last section created at or before timestamp.
+
+        Returns:
+            Section position, or None if every section is newer.
+        """
+        target = (timestamp - _EPOCH) // _MICROSECOND
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._timestamp_micros(mid) <= target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - 1 if lo else None
+
+    def at(self, timestamp):
+        """Return the text of the section current at timestamp, or None."""
+        i = self.find(timestamp)
+        return None if i is None else self.section(i)
+
+    def close(self):
+        """Unmap and close both files."""
+        for mapped in (self._data, self._index):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        for f in (self._data_file, self._index_file):
+            if f is not None:
+                f.close()
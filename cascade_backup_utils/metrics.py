@@ -0,0 +1,318 @@
+"""Module for collecting and exporting metrics.
+
+Backups and consolidations update counters and latency histograms in a
+registry, which can be written out as a Prometheus text file (for example
+for node_exporter's textfile collector) or as JSON:
+
+- cascade_backup_capture_attempts_total{result}: clipboard reads while
+  capturing a conversation, by result ("success" or "empty")
+- cascade_backup_capture_seconds: time to read the clipboard
+- cascade_backup_saves_total{result}: backups written, by result ("success"
+  or "error")
+- cascade_backup_save_seconds: time to write a backup
+- cascade_consolidate_files_total{result}: backup files consolidated, by
+  result ("unique", "duplicate" or "error")
+- cascade_consolidate_bytes_total: bytes of backup files read
+- cascade_consolidate_file_seconds: time to read and clean one backup
+- cascade_consolidate_seconds: duration of consolidation runs
+
+Updating a metric takes a lock and a few additions, so metrics are always
+collected; exporting them is optional.
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_FORMATS = ("prometheus", "json")
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Consolidation runs take much longer than single files
+RUN_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 600, 1800)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if not labels and not self.labelnames:
+            return ()
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def labels(self, **labels):
+        """Return the metric for the given label values.
+
+        The result skips label checks on every update, for use in hot loops.
+        """
+        return self._child(self, self._key(labels))
+
+    def reset(self):
+        """Forget every recorded value."""
+        with self._lock:
+            self._values = {}
+
+
+class _CounterChild:
+    def __init__(self, counter, key):
+        self._counter = counter
+        self._key = key
+
+    def inc(self, amount=1):
+        self._counter._inc(self._key, amount)
+
+
+class _HistogramChild:
+    def __init__(self, histogram, key):
+        self._histogram = histogram
+        self._key = key
+
+    def observe(self, value):
+        self._histogram._observe(self._key, value)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally split by labels."""
+
+    kind = "counter"
+    _child = _CounterChild
+
+    def inc(self, amount=1, **labels):
+        """Add amount to the count for the given label values."""
+        self._inc(self._key(labels), amount)
+
+    def _inc(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Return the count for the given label values."""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, key, (), value
+
+    def _to_dict(self):
+        with self._lock:
+            values = dict(self._values)
+        return [
+            {"labels": dict(zip(self.labelnames, key)), "value": value}
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values, such as latencies in seconds."""
+
+    kind = "histogram"
+    _child = _HistogramChild
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """Record one value."""
+        self._observe(self._key(labels), value)
+
+    def _observe(self, key, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (last one for +Inf), sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][i] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _snapshot(self):
+        with self._lock:
+            return {key: (list(c), s) for key, (c, s) in self._values.items()}
+
+    def _cumulative(self, counts):
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            total += count
+            yield bound, total
+
+    def _samples(self):
+        for key, (counts, total) in sorted(self._snapshot().items()):
+            count = 0
+            for bound, count in self._cumulative(counts):
+                le = (("le", _format_value(bound)),)
+                yield f"{self.name}_bucket", key, le, count
+            yield f"{self.name}_sum", key, (), total
+            yield f"{self.name}_count", key, (), count
+
+    def _to_dict(self):
+        values = []
+        for key, (counts, total) in sorted(self._snapshot().items()):
+            cumulative = list(self._cumulative(counts))
+            values.append(
+                {
+                    "labels": dict(zip(self.labelnames, key)),
+                    "buckets": {_format_value(b): n for b, n in cumulative},
+                    "sum": total,
+                    "count": cumulative[-1][1],
+                }
+            )
+        return values
+
+
+class MetricsRegistry:
+    """Named set of metrics that can be exported together."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """Create and register a Counter."""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Create and register a Histogram."""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name):
+        """Return the metric registered under name."""
+        return self._metrics[name]
+
+    def reset(self):
+        """Reset every metric, e.g. between tests."""
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def to_prometheus(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, extra, value in metric._samples():
+                labels = _format_labels(metric.labelnames, key, extra)
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        """Return every metric as a JSON-serializable dict."""
+        return {
+            metric.name: {
+                "type": metric.kind,
+                "help": metric.documentation,
+                "values": metric._to_dict(),
+            }
+            for metric in self._metrics.values()
+        }
+
+    def write(self, output_path, fmt=None):
+        """Write every metric to output_path atomically.
+
+        Args:
+            output_path: File to write.
+            fmt: One of METRICS_FORMATS ("prometheus" or "json"). If None,
+                 JSON is used for paths ending in .json and the Prometheus
+                 text format otherwise.
+
+        Raises:
+            ValueError: If the format is not supported.
+        """
+        if fmt is None:
+            fmt = "json" if output_path.endswith(".json") else "prometheus"
+        if fmt not in METRICS_FORMATS:
+            raise ValueError(
+                f"Unsupported metrics format: {fmt} "
+                f"(expected one of {', '.join(METRICS_FORMATS)})"
+            )
+        if fmt == "json":
+            text = json.dumps(self.to_dict(), indent=2) + "\n"
+        else:
+            text = self.to_prometheus()
+
+        # Collectors may read the file at any time
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, output_path)
+
+
+REGISTRY = MetricsRegistry()
+
+CAPTURE_ATTEMPTS = REGISTRY.counter(
+    "cascade_backup_capture_attempts_total",
+    "Clipboard reads while capturing a conversation.",
+    ("result",),
+)
+CAPTURE_SECONDS = REGISTRY.histogram(
+    "cascade_backup_capture_seconds", "Time to read the clipboard in seconds."
+)
+SAVES = REGISTRY.counter("cascade_backup_saves_total", "Backups written.", ("result",))
+SAVE_SECONDS = REGISTRY.histogram(
+    "cascade_backup_save_seconds", "Time to write a backup in seconds."
+)
+FILES_CONSOLIDATED = REGISTRY.counter(
+    "cascade_consolidate_files_total",
+    "Backup files consolidated.",
+    ("result",),
+)
+BYTES_PROCESSED = REGISTRY.counter(
+    "cascade_consolidate_bytes_total", "Bytes of backup files read."
+)
+FILE_SECONDS = REGISTRY.histogram(
+    "cascade_consolidate_file_seconds",
+    "Time to read and clean one backup file in seconds.",
+)
+CONSOLIDATE_SECONDS = REGISTRY.histogram(
+    "cascade_consolidate_seconds",
+    "Duration of consolidation runs in seconds.",
+    buckets=RUN_BUCKETS,
+)
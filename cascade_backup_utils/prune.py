@@ -0,0 +1,221 @@
+"""Module for pruning old backup files.
+
+Nothing ever deletes backups, so the backups directory only grows. This
+module applies a retention policy to decide which backups to delete. Backups
+are either full snapshots or delta-encoded against an earlier backup; a
+backup that a kept delta is reconstructed from is always kept.
+
+Policies:
+- keep the last N backups
+- keep the newest backup of each of the last N days, weeks or months
+- drop snapshots whose content is fully contained in a later snapshot
+
+Time-based rules only look at timestamps, which normally come from the
+filename, so no backup has to be opened unless containment checks are on.
+"""
+
+import collections
+import logging
+import os
+
+from cascade_backup_utils.consolidate import BackupConsolidator
+from cascade_backup_utils.delta import DeltaError, base_paths, is_delta
+
+# Number of newer surviving snapshots a backup is checked against
+CONTAINMENT_WINDOW = 8
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionPolicy:
+    """Which backups to keep when pruning.
+
+    Time-based rules are combined: a backup is kept if any rule keeps it.
+    If no time-based rule is set, every backup is kept by time and only
+    drop_contained can remove files.
+    """
+
+    def __init__(
+        self,
+        keep_last=None,
+        keep_daily=None,
+        keep_weekly=None,
+        keep_monthly=None,
+        drop_contained=False,
+    ):
+        """Initialize the policy.
+
+        Args:
+            keep_last: Number of most recent backups to keep.
+            keep_daily: Number of days to keep the newest backup of.
+            keep_weekly: Number of ISO weeks to keep the newest backup of.
+            keep_monthly: Number of months to keep the newest backup of.
+            drop_contained: Also delete backups whose cleaned content is
+                           contained in the next newer surviving backup.
+
+        Raises:
+            ValueError: If a keep_* count is less than 1.
+        """
+        for name, count in (
+            ("keep_last", keep_last),
+            ("keep_daily", keep_daily),
+            ("keep_weekly", keep_weekly),
+            ("keep_monthly", keep_monthly),
+        ):
+            if count is not None and count < 1:
+                raise ValueError(f"{name} must be at least 1, got {count}")
+        self.keep_last = keep_last
+        self.keep_daily = keep_daily
+        self.keep_weekly = keep_weekly
+        self.keep_monthly = keep_monthly
+        self.drop_contained = drop_contained
+
+    @property
+    def has_time_rules(self):
+        """True if any keep_* rule is set."""
+        return any(
+            rule is not None
+            for rule in (
+                self.keep_last,
+                self.keep_daily,
+                self.keep_weekly,
+                self.keep_monthly,
+            )
+        )
+
+
+def _keep_by_period(backups, count, period_of):
+    """Return paths of the newest backup in each of the `count` newest periods.
+
+    Args:
+        backups: (path, timestamp) tuples, newest first.
+        count: Number of periods to keep.
+        period_of: Function mapping a timestamp to its period key.
+    """
+    kept = set()
+    periods = set()
+    for path, timestamp in backups:
+        period = period_of(timestamp)
+        if period in periods:
+            continue
+        if len(periods) >= count:
+            break
+        periods.add(period)
+        kept.add(path)
+    return kept
+
+
+def _apply_time_rules(backups, policy):
+    """Return the set of paths kept by the time-based rules."""
+    if not policy.has_time_rules:
+        return {path for path, _ in backups}
+
+    # The newest backup is always kept
+    kept = {backups[0][0]}
+    if policy.keep_last:
+        kept.update(path for path, _ in backups[: policy.keep_last])
+    if policy.keep_daily:
+        kept |= _keep_by_period(backups, policy.keep_daily, lambda t: t.date())
+    if policy.keep_weekly:
+        kept |= _keep_by_period(
+            backups, policy.keep_weekly, lambda t: t.isocalendar()[:2]
+        )
+    if policy.keep_monthly:
+        kept |= _keep_by_period(
+            backups, policy.keep_monthly, lambda t: (t.year, t.month)
+        )
+    return kept
+
+
+def _drop_contained(consolidator, backups, kept):
+    """Remove backups contained in one of the next newer surviving backups.
+
+    Walks from newest to oldest so every file is read at most once. Only the
+    CONTAINMENT_WINDOW most recent survivors are compared against, which
+    covers a few conversations being backed up in turn without keeping
+    every snapshot's text in memory.
+    """
+    newer_texts = collections.deque(maxlen=CONTAINMENT_WINDOW)
+    for path, timestamp in backups:
+        if path not in kept:
+            continue
+        try:
+            record = consolidator._load_record(path, timestamp)
+        except Exception as e:
+            logger.warning("Error processing %s: %s", path, e)
+            continue
+
+        if any(record.text in text for text in newer_texts):
+            kept.discard(path)
+            continue
+        newer_texts.appendleft(record.text)
+
+
+def plan_prune(backup_dir, policy, key=None):
+    """Compute which backups a policy would delete.
+
+    Backups without a filename or header timestamp are never deleted, and neither is any
+    backup a kept delta-encoded backup is reconstructed from.
+
+    Args:
+        backup_dir: Directory containing backup files.
+        policy: RetentionPolicy to apply.
+        key: Key for encrypted backups. If None, it is loaded from the
+             environment when needed.
+
+    Returns:
+        List of paths to delete, oldest first.
+    """
+    consolidator = BackupConsolidator(backup_dir, key=key)
+    backup_files = consolidator._get_backup_files()
+    backups = [
+        (path, timestamp)
+        for path, timestamp in consolidator._sort_files_by_timestamp(backup_files)
+        if consolidator.timestamp_sources[path] != "mtime"
+    ]
+    if not backups:
+        return []
+    backups.reverse()
+
+    kept = _apply_time_rules(backups, policy)
+    if policy.drop_contained:
+        _drop_contained(consolidator, backups, kept)
+
+    for path in list(kept):
+        if is_delta(path):
+            try:
+                kept.update(base_paths(path))
+            except (OSError, DeltaError) as e:
+                logger.warning("Error processing %s: %s", path, e)
+
+    return [path for path, _ in reversed(backups) if path not in kept]
+
+
+def prune(backup_dir, policy, dry_run=False, key=None):
+    """Delete the backups a retention policy does not keep.
+
+    Args:
+        backup_dir: Directory containing backup files.
+        policy: RetentionPolicy to apply.
+        dry_run: If True, only report what would be deleted.
+        key: Key for encrypted backups (see plan_prune()).
+
+    Returns:
+        List of paths deleted (or that would be deleted in a dry run).
+    """
+    to_delete = plan_prune(backup_dir, policy, key)
+    deleted = []
+    for path in to_delete:
+        if dry_run:
+            logger.info("Would delete: %s", path)
+            deleted.append(path)
+            continue
+        try:
+            os.remove(path)
+            deleted.append(path)
+        except OSError as e:
+            logger.error("Error deleting %s: %s", path, e)
+
+    action = "Would delete" if dry_run else "Deleted"
+    logger.info("%s %d backup file(s) in %s.", action, len(deleted), backup_dir)
+    return deleted
@@ -0,0 +1,267 @@
+"""Module for configurable noise-pattern rules.
+
+The consolidator drops lines that are UI chrome rather than conversation
+text. This module loads those rules from a JSON config file and compiles them
+into a single matcher so the per-line cleaning loop stays cheap.
+
+Rule kinds:
+- literals: drop any line containing the substring
+- regexes: drop any line the regular expression matches (use ``^``/``$`` to
+  anchor to the line)
+- lines: drop lines that equal the value once surrounding whitespace is
+  stripped
+
+Attachment references (see the blobs module) are never dropped, whatever
+rules match them.
+
+Example config::
+
+    {
+        "literals": ["DoneFeedback has been submitted"],
+        "regexes": ["^Cascade \\\\| .* mode"],
+        "lines": ["Image", "Write", "Chat"]
+    }
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+
+from cascade_backup_utils.blobs import is_reference
+
+DEFAULT_RULES = {
+    "literals": [
+        "DoneFeedback has been submitted",
+        "Start with History Ctrl+Enter",
+        "Press Enter again to interrupt and send a new message",
+        "Changes overview (0 files need review)",
+        "Cascade |  mode (Ctrl + .)",
+    ],
+    "regexes": [],
+    "lines": [
+        "Image",
+        "Claude 3.5 Sonnet",
+        "Write",
+        "Chat",
+        "ChatWriteLegacy",
+        "Legacy",
+        "GPT-4o",
+    ],
+}
+
+RULES_FILENAME = "noise_rules.json"
+
+logger = logging.getLogger(__name__)
+
+# Compiled rule sets kept for reuse; a long-running service may see many
+# edits of the rules file
+MATCHER_CACHE_SIZE = 8
+
+# Regex syntax that can match a newline or look past the ends of a line, so a
+# rule using it may match differently in a multi-line buffer than in one line
+_NON_LOCAL_SYNTAX = re.compile(r"\\[AZnsWDx0-7uUN]|\[\^|\(\?<?[=!]|\(\?[a-zA-Z-]*s")
+
+
+class NoiseMatcher:
+    """Compiled form of a rule set.
+
+    All literals and regexes are folded into one alternation so each line is
+    scanned once, and whole-line rules become a set lookup.
+    """
+
+    def __init__(self, literals=(), regexes=(), lines=()):
+        self.literals = tuple(literals)
+        self.regexes = tuple(regexes)
+        self.lines = frozenset(line.strip() for line in lines if not is_reference(line))
+
+        alternatives = [re.escape(lit) for lit in self.literals]
+        alternatives.extend(f"(?:{regex})" for regex in self.regexes)
+        self._alternatives = "|".join(alternatives)
+        self.pattern = re.compile(self._alternatives) if alternatives else None
+        self._blank_pattern = None
+        self.line_local = not any("\n" in lit for lit in self.literals) and not any(
+            "\n" in regex or _NON_LOCAL_SYNTAX.search(regex) for regex in self.regexes
+        )
+
+    @property
+    def digest(self):
+        """Stable hash of the rule set this matcher was compiled from."""
+        return rules_digest(
+            {
+                "literals": self.literals,
+                "regexes": self.regexes,
+                "lines": sorted(self.lines),
+            }
+        )
+
+    def matches(self, line):
+        """Return True if the line is noise and should be dropped."""
+        if self.lines and line.strip() in self.lines:
+            return True
+        if self.pattern and self.pattern.search(line):
+            return not is_reference(line)
+        return False
+
+    def _compile_batch_patterns(self):
+        # A whole-line rule containing a newline can never equal a line
+        lines = sorted(line for line in self.lines if "\n" not in line)
+        whole = "|".join(re.escape(line) for line in lines)
+        whole_branch = rf"(?:(?:{whole})[^\S\n]*)?" if whole else ""
+        # Each match is a newline plus a blank or whole-line-noise line after it
+        self._blank_pattern = re.compile(rf"\n[^\S\n]*{whole_branch}(?=\n)")
+        self._search_pattern = None
+        if self._alternatives:
+            self._search_pattern = re.compile(self._alternatives, re.MULTILINE)
+
+    def remove_lines(self, text):
+        """Remove noise and blank lines from a multi-line text in bulk.
+
+        Equivalent to splitting on newlines, dropping lines for which
+        matches() is true or that are blank, and joining the rest, provided
+        the matcher is line_local. Instead of a Python loop per line, blank
+        and whole-line rules are removed with one regex substitution and the
+        remaining rules are found with a multi-line search that only returns
+        to Python for candidate lines. A match may still run across a
+        newline, so each candidate line is checked on its own with matches()
+        before it is dropped.
+        """
+        if self._blank_pattern is None:
+            self._compile_batch_patterns()
+
+        buffer = self._blank_pattern.sub("", f"\n{text}\n")
+        if self._search_pattern is not None:
+            search = self._search_pattern.search
+            # Stop before the final newline so matches stay within real lines
+            end = len(buffer) - 1
+            kept = []
+            pos = 0
+            match = search(buffer, 1, end)
+            matches = self.matches
+            while match:
+                line_start = buffer.rfind("\n", 0, match.start())
+                line_end = buffer.find("\n", match.start())
+                if matches(buffer[line_start + 1 : line_end]):
+                    kept.append(buffer[pos:line_start])
+                    pos = line_end
+                match = search(buffer, line_end + 1, end)
+            kept.append(buffer[pos:])
+            buffer = "".join(kept)
+        return buffer[1:-1]
+
+
+def rules_digest(rules):
+    """Return a stable hash of a rule set, used as the matcher cache key."""
+    canonical = json.dumps(
+        {key: list(rules.get(key, [])) for key in ("literals", "regexes", "lines")},
+        sort_keys=True,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def compile_rules(rules):
+    """Compile a rule set, reusing a cached matcher for identical rule sets.
+
+    The MATCHER_CACHE_SIZE most recently used matchers are kept.
+
+    Args:
+        rules: Mapping with optional "literals", "regexes" and "lines" lists.
+
+    Returns:
+        NoiseMatcher for the rule set.
+
+    Raises:
+        ValueError: If a regex in the rule set is invalid.
+    """
+    try:
+        return _cached_matcher(
+            tuple(rules.get("literals", [])),
+            tuple(rules.get("regexes", [])),
+            tuple(rules.get("lines", [])),
+        )
+    except re.error as e:
+        raise ValueError(f"Invalid noise rule pattern: {e}") from e
+
+
+@functools.lru_cache(maxsize=MATCHER_CACHE_SIZE)
+def _cached_matcher(literals, regexes, lines):
+    return NoiseMatcher(literals, regexes, lines)
+
+
+def load_rules(path):
+    """Load a rule set from a JSON config file.
+
+    Args:
+        path: Path to the config file.
+
+    Returns:
+        Dict with "literals", "regexes" and "lines" lists.
+
+    Raises:
+        ValueError: If the file is not a JSON object of string lists.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    if not isinstance(data, dict):
+        raise ValueError(f"Noise rules in {path} must be a JSON object")
+
+    rules = {}
+    for key in ("literals", "regexes", "lines"):
+        values = data.get(key, [])
+        if not isinstance(values, list) or not all(
+            isinstance(v, str) for v in values
+        ):
+            raise ValueError(f"'{key}' in {path} must be a list of strings")
+        rules[key] = values
+    return rules
+
+
+class NoiseRules:
+    """Rule set backed by an optional config file, reloaded when it changes.
+
+    When no config file exists the built-in DEFAULT_RULES are used.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._stamp = None
+        self.matcher = compile_rules(DEFAULT_RULES)
+        self.reload_if_changed()
+
+    def _file_stamp(self):
+        if not self.path:
+            return None
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def reload_if_changed(self):
+        """Recompile the matcher if the config file changed since last load.
+
+        Returns:
+            True if the rules were reloaded, False otherwise.
+        """
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return False
+
+        if stamp is None:
+            self.matcher = compile_rules(DEFAULT_RULES)
+        else:
+            try:
+                self.matcher = compile_rules(load_rules(self.path))
+            except (OSError, ValueError) as e:
+                # Keep the previous matcher so a bad edit doesn't stop cleaning
+                logger.error("Error loading noise rules from %s: %s", self.path, e)
+                return False
+        self._stamp = stamp
+        return True
+
+    def matches(self, line):
+        """Return True if the line is noise and should be dropped."""
+        return self.matcher.matches(line)
@@ -0,0 +1,263 @@
+"""Module for running consolidation as a long-lived service.
+
+Instead of re-running cascade-consolidate from cron, the service keeps the
+consolidator's state in memory, polls the backup directories for changes and
+keeps consolidated_conversation.md up to date. New backups that are newer
+than everything already consolidated are appended; anything else (changed or
+deleted backups, edited noise rules) triggers a full rebuild.
+
+A small HTTP server on localhost exposes the service state:
+- GET /status: summary of the consolidated output
+- GET /conversations?since=2025-02-10T00:10: metadata of consolidated
+  sections, optionally only those created at or after a time
+- GET /conversation?digest=<sha256>: cleaned text of one section
+- GET /metrics: counters and histograms in the Prometheus text format (see
+  the metrics module)
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from cascade_backup_utils.consolidate import BackupConsolidator, _SectionWriter
+from cascade_backup_utils.encoding import replace_undecodable
+from cascade_backup_utils.metrics import REGISTRY
+
+DEFAULT_POLL_INTERVAL = 0.5
+DEFAULT_PORT = 8765
+
+logger = logging.getLogger(__name__)
+
+
+class ConsolidationService:
+    """Keep a consolidated file up to date as new backups land."""
+
+    def __init__(self, consolidator=None, poll_interval=DEFAULT_POLL_INTERVAL):
+        """Initialize the service.
+
+        Args:
+            consolidator: BackupConsolidator to run. If None, uses one for the
+                         default backup directory.
+            poll_interval: Seconds between checks for new backups.
+        """
+        self.consolidator = consolidator or BackupConsolidator()
+        self.poll_interval = poll_interval
+        # (path, timestamp, digest) of each section in the consolidated file
+        self.sections = []
+        self.last_update = None
+        self._files = None
+        self._digests = set()
+        self._last_timestamp = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _scan(self):
+        """Return {path: (mtime_ns, size)} for every backup file."""
+        files = {}
+        for file_list in self.consolidator._get_backup_file_lists():
+            for path in file_list:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files[path] = (st.st_mtime_ns, st.st_size)
+        return files
+
+    def _write(self, paths, digests, written):
+        """Consolidate paths into the output file after `written` sections.
+
+        Returns:
+            List of (path, timestamp, digest) for the sections written.
+        """
+        sections = []
+        records = self.consolidator._iter_records([paths], seen_digests=digests)
+        # A rebuild replaces the file at once; appending never truncates it
+        output = _SectionWriter(
+            self.consolidator.consolidated_file, written, atomic=not written
+        )
+        with output as writer:
+            for record in records:
+                writer.write(record)
+                sections.append((record.path, record.timestamp, record.digest))
+        return sections
+
+    def rebuild(self, files=None):
+        """Rewrite the consolidated file from every backup."""
+        if files is None:
+            files = self._scan()
+        # Refilled for the current files, so deleted backups are forgotten
+        self.consolidator.timestamp_sources.clear()
+        sorted_files = self.consolidator._sort_files_by_timestamp(list(files))
+        digests = set()
+        sections = self._write([path for path, _ in sorted_files], digests, 0)
+
+        with self._lock:
+            self._files = files
+            self._digests = digests
+            self._last_timestamp = sorted_files[-1][1] if sorted_files else None
+            self.sections = sections
+            self.last_update = datetime.now()
+
+    def _append(self, files, new_paths):
+        """Append new backups, or rebuild if one is older than the output."""
+        new_files = self.consolidator._sort_files_by_timestamp(new_paths)
+        if (
+            new_files
+            and self._last_timestamp is not None
+            and new_files[0][1] < self._last_timestamp
+        ):
+            self.rebuild(files)
+            return "rebuilt"
+
+        sections = self._write(
+            [path for path, _ in new_files], self._digests, len(self.sections)
+        )
+
+        with self._lock:
+            self._files = files
+            if new_files:
+                self._last_timestamp = new_files[-1][1]
+            self.sections = self.sections + sections
+            self.last_update = datetime.now()
+        return "appended"
+
+    def poll_once(self):
+        """Check the backup directories once and update the output.
+
+        Returns:
+            "rebuilt", "appended", or None if nothing changed.
+        """
+        rules_changed = self.consolidator.noise_rules.reload_if_changed()
+        files = self._scan()
+        known = self._files
+
+        if known is None or rules_changed:
+            self.rebuild(files)
+            return "rebuilt"
+        if files == known:
+            return None
+
+        if any(files.get(path) != stamp for path, stamp in known.items()):
+            self.rebuild(files)
+            return "rebuilt"
+
+        return self._append(files, [path for path in files if path not in known])
+
+    def run(self):
+        """Poll until stop() is called."""
+        while not self._stop.is_set():
+            try:
+                result = self.poll_once()
+                if result:
+                    logger.info(
+                        "Consolidated file %s: %s",
+                        result,
+                        self.consolidator.consolidated_file,
+                    )
+            except Exception as e:
+                logger.error("Error updating consolidated file: %s", e)
+                # Start from scratch on the next poll
+                self._files = None
+            self._stop.wait(self.poll_interval)
+
+    def stop(self):
+        """Stop the polling loop."""
+        self._stop.set()
+
+    def status(self):
+        """Return a JSON-serializable summary of the service state."""
+        with self._lock:
+            return {
+                "backup_dirs": [
+                    self.consolidator.backup_dir,
+                    *self.consolidator.extra_dirs,
+                ],
+                "consolidated_file": self.consolidator.consolidated_file,
+                "backup_files": len(self._files or {}),
+                "conversations": len(self.sections),
+                "last_timestamp": _isoformat(self._last_timestamp),
+                "last_update": _isoformat(self.last_update),
+            }
+
+    def conversations(self, since=None):
+        """Return metadata of consolidated sections created at or after since."""
+        with self._lock:
+            sections = self.sections
+        return [
+            {"path": path, "timestamp": timestamp.isoformat(), "digest": digest}
+            for path, timestamp, digest in sections
+            if since is None or timestamp >= since
+        ]
+
+    def conversation(self, digest):
+        """Return the consolidated section with the given digest, or None."""
+        with self._lock:
+            sections = self.sections
+        for path, timestamp, section_digest in sections:
+            if section_digest == digest:
+                record = self.consolidator._load_record(path, timestamp)
+                return replace_undecodable(record.section)
+        return None
+
+
+def _isoformat(timestamp):
+    return timestamp.isoformat() if timestamp else None
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    def _send(self, status, body, content_type="application/json"):
+        if content_type == "application/json":
+            body = json.dumps(body)
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        service = self.server.service
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if url.path == "/status":
+            self._send(200, service.status())
+        elif url.path == "/conversations":
+            since = query.get("since", [None])[0]
+            try:
+                since = datetime.fromisoformat(since) if since else None
+            except ValueError:
+                self._send(400, {"error": f"Invalid timestamp: {since}"})
+                return
+            self._send(200, service.conversations(since))
+        elif url.path == "/conversation":
+            text = service.conversation(query.get("digest", [""])[0])
+            if text is None:
+                self._send(404, {"error": "Conversation not found"})
+            else:
+                self._send(200, text, "text/markdown")
+        elif url.path == "/metrics":
+            self._send(200, REGISTRY.to_prometheus(), "text/plain; version=0.0.4")
+        else:
+            self._send(404, {"error": "Not found"})
+
+    def log_message(self, format, *args):
+        # Keep the console for service messages
+        pass
+
+
+def start_http_server(service, host="127.0.0.1", port=DEFAULT_PORT):
+    """Serve the service's status endpoints from a background thread.
+
+    Returns:
+        The running ThreadingHTTPServer; call shutdown() to stop it.
+    """
+    server = ThreadingHTTPServer((host, port), _RequestHandler)
+    server.service = service
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
@@ -168,3 +168,33 @@ def test_backup_retry_success(backup_dir, monkeypatch):
     # Check content
     backup_content = backup_files[0].read_text()
     assert "Test conversation" in backup_content
+
+
+def test_backup_skips_unreadable_attachments(backup_dir, monkeypatch, caplog):
+    """Test that a failing attachment does not lose the backup."""
+    backup = CascadeBackup()
+    monkeypatch.setattr(backup, "backup_dir", str(backup_dir))
+    backup.capture_attachments = True
+    monkeypatch.setattr(backup, "copy_conversation", lambda: "Test conversation")
+    monkeypatch.setattr("builtins.input", lambda _: "")
+
+    notes = backup_dir / "notes.txt"
+    notes.write_text("notes")
+
+    class BrokenImage:
+        def save(self, fp, format=None):
+            raise OSError("cannot write mode P as PNG")
+
+    # A file deleted after it was copied, a broken image, then a readable file
+    clipboard = [[str(backup_dir / "deleted.png"), BrokenImage(), str(notes)], []]
+    monkeypatch.setattr(backup, "get_clipboard_attachments", lambda: clipboard.pop(0))
+
+    backup.backup()
+
+    backup_files = list(backup_dir.glob("backup_*.md"))
+    assert len(backup_files) == 1
+    content = backup_files[0].read_text()
+    assert "Test conversation" in content
+    assert "[notes.txt](blobs/" in content
+    assert "deleted.png" not in content and "![image]" not in content
+    assert caplog.text.count("Skipping attachment") == 2
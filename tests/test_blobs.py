@@ -0,0 +1,80 @@
+"""Tests for the blobs module."""
+import os
+from cascade_backup_utils.blobs import (
+    BlobStore,
+    is_reference,
+    rebase_references,
+    reference,
+)
+from cascade_backup_utils.consolidate import BackupConsolidator
+
+DIGEST = "3f" + "0" * 62
+
+
+def test_put_deduplicates_by_content(tmp_path):
+    store = BlobStore(str(tmp_path))
+    source = tmp_path / "Screenshot.PNG"
+    source.write_bytes(b"\x89PNG data")
+
+    path = store.put_file(str(source))
+    assert path.startswith("blobs/") and path.endswith(".png")
+    assert store.put_bytes(b"\x89PNG data", "other.png") == path
+    assert store.put_bytes(b"other data", "other.png") != path
+
+    assert (tmp_path / path).read_bytes() == b"\x89PNG data"
+    files = [name for _, _, names in os.walk(tmp_path / "blobs") for name in names]
+    assert len(files) == 2
+
+
+def test_reference_format():
+    path = f"blobs/3f/{DIGEST}.png"
+    assert reference(path, "image", image=True) == f"![image]({path})"
+    assert reference(path, "notes [v2].txt") == f"[notes (v2).txt]({path})"
+    assert is_reference(reference(path, "image", image=True))
+    assert not is_reference(f"see ![image]({path})")
+    assert not is_reference("![image](blobs/3f/not-a-digest.png)")
+
+
+def test_rebase_references():
+    text = f"Hello\n![image](blobs/3f/{DIGEST}.png)\nblobs/3f/{DIGEST}\n"
+    assert rebase_references(text, "../laptop") == (
+        f"Hello\n![image](../laptop/blobs/3f/{DIGEST}.png)\nblobs/3f/{DIGEST}\n"
+    )
+
+
+def test_references_survive_noise_rules(tmp_path):
+    (tmp_path / "noise_rules.json").write_text(
+        '{"literals": ["blobs/"], "regexes": ["image"], '
+        f'"lines": ["![image](blobs/3f/{DIGEST}.png)"]}}'
+    )
+    consolidator = BackupConsolidator(str(tmp_path))
+    line = f"![image](blobs/3f/{DIGEST}.png)"
+    content = f"Hello\n{line}\nblobs/ mentioned\nan image"
+
+    assert consolidator.clean_content(content) == f"Hello\n{line}"
+    assert consolidator.clean_many([content, content]) == [f"Hello\n{line}"] * 2
+
+
+def test_consolidate_rebases_extra_dirs(tmp_path):
+    for name in ("laptop", "desktop"):
+        backup_dir = tmp_path / name
+        backup_dir.mkdir()
+        path = BlobStore(str(backup_dir)).put_bytes(name.encode(), "shot.png")
+        (backup_dir / "backup_2024-01-01_10-00-00.md").write_text(
+            f"*Backup created on: 2024-01-01 10:00:00*\n\n"
+            f"From {name}\n{reference(path, 'image', image=True)}"
+        )
+
+    consolidator = BackupConsolidator(
+        str(tmp_path / "laptop"), extra_dirs=[str(tmp_path / "desktop")]
+    )
+    consolidator.consolidate()
+
+    with open(consolidator.consolidated_file, encoding="utf-8") as f:
+        text = f.read()
+    references = [line for line in text.splitlines() if is_reference(line)]
+    assert len(references) == 2
+    for line in references:
+        target = line[line.index("(") + 1 : -1]
+        assert (tmp_path / "laptop" / target).exists()
+    assert any("(../desktop/blobs/" in line for line in references)
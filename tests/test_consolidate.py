@@ -1,5 +1,10 @@
+import json
+import logging
 import os
-from cascade_backup_utils.consolidate import BackupConsolidator
+import pytest
+from datetime import datetime
+from cascade_backup_utils.consolidate import BackupConsolidator, consolidate_projects
+from cascade_backup_utils.index import ConsolidatedReader
 
 
 def test_consolidate_backups(tmp_path, monkeypatch):
@@ -187,11 +192,12 @@ Test content with invalid timestamp"""
     # Consolidate backups
     consolidator.consolidate()
 
-    # Check that file was created but content was handled gracefully
+    # Check that the file falls back to its modification time
     consolidated_file = backup_dir / "consolidated_conversation.md"
     assert consolidated_file.exists()
     consolidated_content = consolidated_file.read_text()
-    assert "Test content with invalid timestamp" not in consolidated_content
+    assert "Test content with invalid timestamp" in consolidated_content
+    assert consolidator.timestamp_sources[str(backup_dir / "backup1.md")] == "mtime"
 
 
 def test_consolidate_filename_timestamp(tmp_path, monkeypatch):
@@ -258,3 +264,336 @@ def test_consolidate_read_error(tmp_path, monkeypatch):
 
     # Verify the consolidated file was not created
     assert not os.path.exists(consolidator.consolidated_file)
+
+
+def test_iter_conversations(tmp_path):
+    # Create backup directory
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+
+    # Files written out of order, one duplicate
+    test_files = [
+        (
+            "backup_2024-01-01_12-00-00.md",
+            "*Backup created on: 2024-01-01 12:00:00*\nLater content",
+        ),
+        (
+            "backup_2024-01-01_10-00-00.md",
+            "*Backup created on: 2024-01-01 10:00:00*\nEarlier content\nImage",
+        ),
+        (
+            "backup_2024-01-01_11-00-00.md",
+            "*Backup created on: 2024-01-01 11:00:00*\nEarlier content",
+        ),
+    ]
+
+    for filename, content in test_files:
+        (backup_dir / filename).write_text(content)
+
+    consolidator = BackupConsolidator(str(backup_dir))
+    records = list(consolidator.iter_conversations())
+
+    assert [r.text for r in records] == ["Earlier content", "Later content"]
+    assert [r.timestamp.hour for r in records] == [10, 12]
+    assert records[0].path == str(backup_dir / "backup_2024-01-01_10-00-00.md")
+    assert records[0].header == "*Backup created on: 2024-01-01 10:00:00*"
+    assert len(records[0].digest) == 64
+    assert records[0].section == (
+        "*Backup created on: 2024-01-01 10:00:00*\nEarlier content"
+    )
+
+    # Nothing is written by the iterator
+    assert not (backup_dir / "consolidated_conversation.md").exists()
+
+
+def test_consolidate_multiple_dirs(tmp_path):
+    # One backup directory per machine, with interleaved timestamps
+    dir_a = tmp_path / "machine_a"
+    dir_b = tmp_path / "machine_b"
+    os.makedirs(dir_a, exist_ok=True)
+    os.makedirs(dir_b, exist_ok=True)
+
+    for backup_dir, hours in ((dir_a, (9, 11)), (dir_b, (10, 12))):
+        for hour in hours:
+            (backup_dir / f"backup_2024-01-01_{hour:02d}-00-00.md").write_text(
+                f"*Backup created on: 2024-01-01 {hour:02d}:00:00*\nHour {hour}"
+            )
+    (dir_b / "backup_2024-01-01_13-00-00.md").write_text(
+        "*Backup created on: 2024-01-01 13:00:00*\nHour 9"
+    )
+
+    consolidator = BackupConsolidator(str(dir_a), extra_dirs=[str(dir_b)])
+    consolidator.consolidate()
+
+    consolidated_content = (dir_a / "consolidated_conversation.md").read_text()
+    positions = [consolidated_content.index(f"Hour {h}") for h in (9, 10, 11, 12)]
+    assert positions == sorted(positions)
+    # Duplicates are removed across directories
+    assert consolidated_content.count("Hour 9") == 1
+    assert not (dir_b / "consolidated_conversation.md").exists()
+
+
+def test_consolidate_projects(tmp_path):
+    # Three projects, one of them empty
+    projects = {
+        "project_a": [("10", "Shared content"), ("12", "Only in A")],
+        "project_b": [("11", "Shared content"), ("13", "Only in B")],
+        "project_c": [],
+    }
+    for name, backups in projects.items():
+        backup_dir = tmp_path / name
+        os.makedirs(backup_dir, exist_ok=True)
+        for hour, text in backups:
+            (backup_dir / f"backup_2024-01-01_{hour}-00-00.md").write_text(
+                f"*Backup created on: 2024-01-01 {hour}:00:00*\n{text}"
+            )
+
+    global_file = tmp_path / "all.md"
+    counts = consolidate_projects(
+        [str(tmp_path / name) for name in projects],
+        global_file=str(global_file),
+        workers=2,
+    )
+
+    assert counts == {
+        str(tmp_path / "project_a"): 2,
+        str(tmp_path / "project_b"): 2,
+    }
+    content_a = (tmp_path / "project_a" / "consolidated_conversation.md").read_text()
+    content_b = (tmp_path / "project_b" / "consolidated_conversation.md").read_text()
+    assert "Only in A" in content_a and "Only in B" not in content_a
+    assert "Only in B" in content_b and "Shared content" in content_b
+    assert not (tmp_path / "project_c" / "consolidated_conversation.md").exists()
+
+    global_content = global_file.read_text()
+    assert global_content.count("Shared content") == 1
+    assert global_content.index("Only in A") < global_content.index("Only in B")
+
+
+def test_consolidate_projects_keeps_outputs_when_interrupted(tmp_path, monkeypatch):
+    backup_dir = tmp_path / "project"
+    os.makedirs(backup_dir, exist_ok=True)
+    write_hourly_backups(backup_dir, [10, 11])
+    global_file = tmp_path / "all.md"
+    consolidate_projects([str(backup_dir)], global_file=str(global_file))
+    outputs = [backup_dir / "consolidated_conversation.md", global_file]
+    previous = [path.read_bytes() for path in outputs]
+
+    write_hourly_backups(backup_dir, [12])
+    load_record = BackupConsolidator._load_record
+
+    def crashing_load(self, file_path, timestamp):
+        if file_path.endswith("10-00-00.md"):
+            raise KeyboardInterrupt
+        return load_record(self, file_path, timestamp)
+
+    monkeypatch.setattr(BackupConsolidator, "_load_record", crashing_load)
+    with pytest.raises(KeyboardInterrupt):
+        consolidate_projects([str(backup_dir)], global_file=str(global_file))
+
+    assert [path.read_bytes() for path in outputs] == previous
+    assert not list(tmp_path.glob("**/*.partial*"))
+    with ConsolidatedReader(str(global_file)) as reader:
+        assert len(reader) == 2
+
+
+def test_clean_many_matches_clean_content(tmp_path):
+    consolidator = BackupConsolidator(str(tmp_path))
+    documents = [
+        "*Backup created on: 2024-01-01 10:00:00*\nHello\n\n\nImage\nWorld  ",
+        "Image\nChat\n   \n",
+        "",
+        "   leading and trailing   \nDoneFeedback has been submitted twice\n",
+        "Text *Backup created on: 2024-01-01 11:00:00* inline\nWrite\n  Write  \n",
+        "Write a parser for the Image format\r\n\tTabbed\r\n\x0b\n",
+        "GPT-4o\nGPT-4o is good\nlast line without newline",
+    ]
+
+    expected = [consolidator.clean_content(doc) for doc in documents]
+    assert consolidator.clean_many(documents) == expected
+    assert consolidator.clean_many([]) == []
+
+    # Documents containing the internal separator use the per-file path
+    documents.append("odd \x00 content\nImage")
+    expected.append(consolidator.clean_content(documents[-1]))
+    assert consolidator.clean_many(documents) == expected
+
+
+@pytest.mark.parametrize(
+    "rules",
+    [
+        {"regexes": ["foo\\s+bar"]},
+        {"literals": ["foo\nbar"]},
+        {"lines": ["foo\nbar"]},
+        {"regexes": ["\\Aabc", "end\\Z"]},
+        {"regexes": ["abc(?!\\n)"]},
+        # Line-local by syntax, but the range includes the newline
+        {"regexes": ["foo[\\t-\\r]+bar"]},
+        {"regexes": ["^abc$", "o b"]},
+    ],
+)
+def test_clean_many_matches_clean_content_with_multiline_rules(tmp_path, rules):
+    (tmp_path / "noise_rules.json").write_text(json.dumps(rules))
+    consolidator = BackupConsolidator(str(tmp_path))
+    documents = [
+        "keep foo\nbar keep",
+        "abc",
+        "xabc\nabc\nthe end",
+        "foo\nbar\nfoo bar",
+    ]
+
+    expected = [consolidator.clean_content(doc) for doc in documents]
+    assert consolidator.clean_many(documents) == expected
+
+
+def test_timestamp_sources_and_missing_header(tmp_path):
+    # Create backup directory
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+
+    (backup_dir / "backup_20240101_100000.md").write_text(
+        "*Backup created on: 2024-01-01 10:00:00*\nFrom filename"
+    )
+    (backup_dir / "old_export.md").write_text(
+        "*Backup created on: 2024-01-01 11:00:00*\nFrom header"
+    )
+    # No header at all: ordered by modification time and still consolidated
+    no_header = backup_dir / "notes.md"
+    no_header.write_text("From mtime")
+    mtime = datetime(2024, 1, 1, 12, 0, 0).timestamp()
+    os.utime(no_header, (mtime, mtime))
+
+    consolidator = BackupConsolidator(str(backup_dir))
+    records = list(consolidator.iter_conversations())
+
+    assert [r.text for r in records] == ["From filename", "From header", "From mtime"]
+    assert records[2].header == "*Backup created on: 2024-01-01 12:00:00*"
+    assert consolidator.timestamp_sources == {
+        str(backup_dir / "backup_20240101_100000.md"): "filename",
+        str(backup_dir / "old_export.md"): "header",
+        str(no_header): "mtime",
+    }
+
+
+@pytest.mark.parametrize("memory_limit", [None, 1])
+def test_rename_legacy_files(tmp_path, memory_limit):
+    # Create backup directory
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+
+    (backup_dir / "backup_20240101_100000.md").write_text(
+        "*Backup created on: 2024-01-01 10:00:00*\nAlready named"
+    )
+    (backup_dir / "copy.md").write_text(
+        "*Backup created on: 2024-01-01 10:00:00*\nSame second"
+    )
+    (backup_dir / "other.md").write_text(
+        "*Backup created on: 2024-01-02 09:30:00*\nLegacy name"
+    )
+
+    consolidator = BackupConsolidator(str(backup_dir), memory_limit=memory_limit)
+    planned = consolidator.rename_legacy_files(dry_run=True)
+    assert (backup_dir / "copy.md").exists()
+
+    renamed = consolidator.rename_legacy_files()
+    assert renamed == planned
+    assert sorted(os.listdir(backup_dir)) == [
+        "backup_20240101_100000.md",
+        "backup_20240101_100000_1.md",
+        "backup_20240102_093000.md",
+    ]
+
+    consolidator = BackupConsolidator(str(backup_dir))
+    consolidator.consolidate()
+    assert set(consolidator.timestamp_sources.values()) == {"filename"}
+
+
+def write_hourly_backups(backup_dir, hours):
+    for hour in hours:
+        (backup_dir / f"backup_2024-01-01_{hour:02d}-00-00.md").write_text(
+            f"*Backup created on: 2024-01-01 {hour:02d}:00:00*\nConversation {hour}"
+        )
+
+
+def interrupt_at(consolidator, monkeypatch, name):
+    """Make consolidation stop abruptly when it reaches the named backup."""
+    load_record = consolidator._load_record
+    loaded = []
+
+    def crashing_load(file_path, timestamp):
+        if file_path.endswith(name):
+            raise KeyboardInterrupt
+        loaded.append(os.path.basename(file_path))
+        return load_record(file_path, timestamp)
+
+    monkeypatch.setattr(consolidator, "_load_record", crashing_load)
+    return loaded
+
+
+def test_consolidate_resumes_from_checkpoint(tmp_path, monkeypatch, caplog):
+    caplog.set_level(logging.INFO, logger="cascade_backup_utils")
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+    write_hourly_backups(backup_dir, range(10, 15))
+
+    consolidator = BackupConsolidator(str(backup_dir))
+    consolidator.checkpoint_interval = 0
+    interrupt_at(consolidator, monkeypatch, "13-00-00.md")
+    with pytest.raises(KeyboardInterrupt):
+        consolidator.consolidate()
+
+    output = consolidator.consolidated_file
+    assert not os.path.exists(output)
+    assert os.path.exists(output + ".partial")
+    assert os.path.exists(output + ".checkpoint")
+
+    resumed = BackupConsolidator(str(backup_dir))
+    loaded = interrupt_at(resumed, monkeypatch, "never")
+    resumed.consolidate()
+    assert "Resuming consolidation after" in caplog.text
+    assert loaded == ["backup_2024-01-01_13-00-00.md", "backup_2024-01-01_14-00-00.md"]
+    assert not os.path.exists(output + ".partial")
+    assert not os.path.exists(output + ".checkpoint")
+
+    with open(output, encoding="utf-8") as f:
+        content = f.read()
+    fresh = BackupConsolidator(str(backup_dir))
+    fresh.consolidated_file = str(tmp_path / "fresh.md")
+    fresh.consolidate()
+    assert content == (tmp_path / "fresh.md").read_text(encoding="utf-8")
+
+
+# The added backup is newer than the checkpoint, or copied with its original
+# mtime preserved (rsync -a, cp -p)
+@pytest.mark.parametrize("mtime_offset", [1, -24 * 3600])
+def test_consolidate_restarts_when_older_backup_added(
+    tmp_path, monkeypatch, mtime_offset
+):
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+    write_hourly_backups(backup_dir, [10, 12, 13])
+
+    consolidator = BackupConsolidator(str(backup_dir))
+    consolidator.consolidate()
+    previous = (backup_dir / "consolidated_conversation.md").read_text()
+
+    consolidator.checkpoint_interval = 0
+    interrupt_at(consolidator, monkeypatch, "13-00-00.md")
+    with pytest.raises(KeyboardInterrupt):
+        consolidator.consolidate()
+    # The last complete output is kept until a new one is finished
+    assert (backup_dir / "consolidated_conversation.md").read_text() == previous
+
+    checkpoint_time = os.stat(consolidator.consolidated_file + ".checkpoint").st_mtime
+    write_hourly_backups(backup_dir, [11])
+    os.utime(
+        backup_dir / "backup_2024-01-01_11-00-00.md",
+        (checkpoint_time + mtime_offset, checkpoint_time + mtime_offset),
+    )
+
+    resumed = BackupConsolidator(str(backup_dir))
+    loaded = interrupt_at(resumed, monkeypatch, "never")
+    resumed.consolidate()
+    assert len(loaded) == 4
+    content = (backup_dir / "consolidated_conversation.md").read_text()
+    assert [f"Conversation {h}" in content for h in (10, 11, 12, 13)] == [True] * 4
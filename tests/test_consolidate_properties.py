@@ -0,0 +1,290 @@
+"""Property-based and scale tests for the consolidate module.
+
+Random backup corpora are consolidated in every mode and compared with
+reference_output(), a deliberately naive implementation of what
+consolidation should produce.
+"""
+import codecs
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import NamedTuple
+from hypothesis import given, settings, strategies as st
+from cascade_backup_utils.consolidate import (
+    SECTION_SEPARATOR,
+    BackupConsolidator,
+    consolidate_projects,
+)
+from cascade_backup_utils.index import ConsolidatedReader
+from cascade_backup_utils.serve import ConsolidationService
+
+START = datetime(2024, 1, 1)
+
+# Lines the default noise rules drop, and blank lines
+NOISE_LINES = [
+    "Image",
+    "  Chat  ",
+    "GPT-4o",
+    "DoneFeedback has been submitted",
+    "Cascade |  mode (Ctrl + .) 3 files",
+    "",
+    "   ",
+]
+
+# How a backup's timestamp is found: its name, its header or its mtime
+SCHEMES = ("dashed", "compact", "header", "mtime")
+
+
+class Backup(NamedTuple):
+    """A generated backup file."""
+
+    directory: int
+    scheme: str
+    timestamp: datetime
+    has_header: bool
+    lines: list
+    raw: list
+    crlf: bool
+    bom: bool
+
+    @property
+    def name(self):
+        if self.scheme == "dashed":
+            return f"backup_{self.timestamp:%Y-%m-%d_%H-%M-%S}.md"
+        if self.scheme == "compact":
+            return f"cascade_backup_{self.timestamp:%Y%m%d_%H%M%S}.md"
+        return f"notes_{self.timestamp:%j%H%M%S}.md"
+
+    @property
+    def header(self):
+        return f"*Backup created on: {self.timestamp:%Y-%m-%d %H:%M:%S}*"
+
+    def content(self):
+        body = "\n".join(self.raw)
+        return f"{self.header}\n\n{body}" if self.has_header else body
+
+    def data(self):
+        """The file's bytes, as written by the tool that captured it."""
+        data = self.content().encode("utf-8", "surrogateescape")
+        if self.crlf:
+            data = data.replace(b"\n", b"\r\n")
+        if self.bom:
+            data = codecs.BOM_UTF8 + data
+        return data
+
+
+words = st.text(alphabet="abcdefghijklmnopqrstuvwxyz0123456789", min_size=1, max_size=8)
+# "\udce9" is how a Latin-1 "é", which is not valid UTF-8, is decoded
+conversation_lines = st.builds(
+    lambda indent, line, suffix: indent + " ".join(line) + suffix,
+    st.sampled_from(["", "  ", "- ", "# "]),
+    st.lists(words, min_size=1, max_size=5),
+    st.sampled_from(["", "", " caf\udce9"]),
+)
+
+
+@st.composite
+def corpora(draw, max_files=12):
+    """Draw a list of Backups with distinct timestamps.
+
+    Bodies come from a small pool so that many backups are duplicates once
+    their noise lines are removed.
+    """
+    pool = draw(st.lists(st.lists(conversation_lines, max_size=5), min_size=1))
+    count = draw(st.integers(1, max_files))
+    offsets = draw(
+        st.lists(
+            st.integers(0, 3 * 24 * 3600), min_size=count, max_size=count, unique=True
+        )
+    )
+    corpus = []
+    for offset in offsets:
+        lines = draw(st.sampled_from(pool))
+        raw = list(lines)
+        for _ in range(draw(st.integers(0, 3))):
+            raw.insert(
+                draw(st.integers(0, len(raw))), draw(st.sampled_from(NOISE_LINES))
+            )
+        scheme = draw(st.sampled_from(SCHEMES))
+        has_header = scheme == "header" or (scheme != "mtime" and draw(st.booleans()))
+        corpus.append(
+            Backup(
+                draw(st.integers(0, 1)),
+                scheme,
+                START + timedelta(seconds=offset),
+                has_header,
+                lines,
+                raw,
+                draw(st.booleans()),
+                draw(st.booleans()),
+            )
+        )
+    return corpus
+
+
+def reference_sections(corpus):
+    """Sections consolidation should write, oldest first, without duplicates."""
+    sections = []
+    seen = set()
+    for backup in sorted(corpus, key=lambda b: b.timestamp):
+        text = "\n".join(backup.lines).strip()
+        if text not in seen:
+            seen.add(text)
+            sections.append(f"{backup.header}\n{text}")
+    return sections
+
+
+def reference_output(corpus):
+    return SECTION_SEPARATOR.join(reference_sections(corpus))
+
+
+def write_corpus(corpus, dirs):
+    for backup in corpus:
+        path = os.path.join(dirs[backup.directory], backup.name)
+        with open(path, "wb") as f:
+            f.write(backup.data())
+        mtime = time.mktime(backup.timestamp.timetuple())
+        os.utime(path, (mtime, mtime))
+
+
+def make_dirs(root, count=2):
+    dirs = [os.path.join(root, f"machine_{i}") for i in range(count)]
+    for directory in dirs:
+        os.makedirs(directory)
+    return dirs
+
+
+def make_consolidator(dirs, output, **kwargs):
+    consolidator = BackupConsolidator(dirs[0], extra_dirs=dirs[1:], **kwargs)
+    consolidator.consolidated_file = output
+    return consolidator
+
+
+def read_text(path):
+    with open(path, encoding="utf-8", errors="surrogateescape") as f:
+        return f.read()
+
+
+def interrupted_then_resumed(dirs, output, stop_after, memory_limit):
+    """Consolidate, crashing after stop_after files, then run again."""
+    consolidator = make_consolidator(dirs, output, memory_limit=memory_limit)
+    consolidator.checkpoint_interval = 0
+    load_record = consolidator._load_record
+    loaded = []
+
+    def crashing_load(file_path, timestamp):
+        if len(loaded) == stop_after:
+            raise KeyboardInterrupt
+        loaded.append(file_path)
+        return load_record(file_path, timestamp)
+
+    consolidator._load_record = crashing_load
+    try:
+        consolidator.consolidate()
+    except KeyboardInterrupt:
+        pass
+    make_consolidator(dirs, output, memory_limit=memory_limit).consolidate()
+    return read_text(output)
+
+
+@settings(max_examples=40, deadline=None)
+@given(corpus=corpora(), stop_after=st.integers(0, 12), bounded=st.booleans())
+def test_consolidation_modes_match_reference(corpus, stop_after, bounded):
+    expected = reference_output(corpus)
+
+    with tempfile.TemporaryDirectory() as root:
+        dirs = make_dirs(root)
+        write_corpus(corpus, dirs)
+        out = os.path.join(root, "out")
+        os.makedirs(out)
+
+        def output(mode):
+            return os.path.join(out, f"{mode}.md")
+
+        make_consolidator(dirs, output("default")).consolidate()
+        make_consolidator(dirs, output("workers")).consolidate(workers=3)
+        make_consolidator(dirs, output("bounded"), memory_limit=1).consolidate()
+        for mode in ("default", "workers", "bounded"):
+            assert read_text(output(mode)) == expected, mode
+
+        resumed = interrupted_then_resumed(
+            dirs, output("resumed"), stop_after, 1 if bounded else None
+        )
+        assert resumed == expected
+
+        consolidator = make_consolidator(dirs, output("default"))
+        records = list(consolidator.iter_conversations())
+        assert [r.section for r in records] == reference_sections(corpus)
+
+        with ConsolidatedReader(output("default")) as reader:
+            sections = [reader.section(i) for i in range(len(reader))]
+        assert sections == reference_sections(corpus)
+
+        consolidate_projects(dirs, global_file=output("global"), workers=2)
+        assert read_text(output("global")) == expected
+
+
+@settings(max_examples=25, deadline=None)
+@given(corpus=corpora(), split=st.integers(0, 12))
+def test_service_matches_reference(corpus, split):
+    with tempfile.TemporaryDirectory() as root:
+        dirs = make_dirs(root)
+        service = ConsolidationService(
+            make_consolidator(dirs, os.path.join(root, "consolidated.md"))
+        )
+
+        # New backups may arrive in any order, forcing a rebuild or not
+        write_corpus(corpus[:split], dirs)
+        service.poll_once()
+        write_corpus(corpus[split:], dirs)
+        service.poll_once()
+
+        consolidated_file = service.consolidator.consolidated_file
+        assert read_text(consolidated_file) == reference_output(corpus)
+
+
+@settings(max_examples=100, deadline=None)
+@given(corpus=corpora())
+def test_clean_many_matches_clean_content(corpus):
+    consolidator = BackupConsolidator(tempfile.gettempdir())
+    documents = [backup.content() for backup in corpus]
+    expected = [consolidator.clean_content(doc) for doc in documents]
+    assert consolidator.clean_many(documents) == expected
+
+
+def test_large_corpus_within_budgets(tmp_path):
+    """Consolidate 4000 backups within time and Python heap budgets.
+
+    tracemalloc only sees Python allocations, so SQLite's page cache in
+    bounded-memory mode is not counted; it is capped by the memory limit.
+    """
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir)
+    count = 4000
+    for i in range(count):
+        timestamp = START + timedelta(minutes=i)
+        (backup_dir / f"backup_{timestamp:%Y-%m-%d_%H-%M-%S}.md").write_text(
+            f"*Backup created on: {timestamp:%Y-%m-%d %H:%M:%S}*\n\n"
+            f"Conversation {i % (count // 2)}\nImage\n" + "some words of text\n" * 40
+        )
+
+    # (memory_limit, peak heap budget in bytes); each run takes about 3s here
+    for memory_limit, peak_budget in ((None, 8_000_000), (1, 2_000_000)):
+        consolidator = BackupConsolidator(str(backup_dir), memory_limit=memory_limit)
+        tracemalloc.start()
+        try:
+            start = time.perf_counter()
+            consolidator.consolidate()
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        assert elapsed < 60, (memory_limit, elapsed)
+        assert peak < peak_budget, (memory_limit, peak)
+        with ConsolidatedReader(consolidator.consolidated_file) as reader:
+            assert len(reader) == count // 2
+            timestamps = [reader.entry(i).timestamp for i in range(len(reader))]
+        assert timestamps == sorted(timestamps)
@@ -0,0 +1,133 @@
+"""Tests for the delta module."""
+import os
+import pytest
+from cascade_backup_utils.consolidate import BackupConsolidator
+from cascade_backup_utils.delta import (
+    DeltaError,
+    apply_delta,
+    chain_length,
+    make_delta,
+    read_added_text,
+    read_snapshot,
+    write_snapshot,
+)
+from cascade_backup_utils.prune import RetentionPolicy, plan_prune
+
+
+def snapshot(hour, lines):
+    return f"*Backup created on: 2024-01-01 {hour:02d}:00:00*\n\n" + "\n".join(lines)
+
+
+def test_make_and_apply_delta():
+    base = "line 1\nline 2\nline 3\n"
+    new = "line 1\nchanged\nline 3\nline 4\n"
+    ops, inserted = make_delta(base, new)
+
+    assert inserted == 2
+    assert apply_delta(base, ops) == new
+
+
+def test_write_snapshot_chain_and_keyframes(tmp_path):
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+
+    lines = [f"Message {i}" for i in range(20)]
+    texts = []
+    paths = []
+    for hour in range(5):
+        lines.append(f"Reply {hour}")
+        texts.append(snapshot(hour, lines))
+        paths.append(
+            write_snapshot(
+                str(backup_dir),
+                f"backup_20240101_{hour:02d}0000",
+                texts[-1],
+                keyframe_interval=3,
+            )
+        )
+
+    assert [os.path.splitext(p)[1] for p in paths] == [
+        ".md",
+        ".delta",
+        ".delta",
+        ".md",
+        ".delta",
+    ]
+    assert [chain_length(p) for p in paths] == [0, 1, 2, 0, 1]
+    for path, text in zip(paths, texts):
+        assert read_snapshot(path) == text
+    assert read_added_text(paths[2]) == (
+        "*Backup created on: 2024-01-01 02:00:00*\nReply 2"
+    )
+
+
+def test_write_snapshot_unrelated_content_is_full(tmp_path):
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+    write_snapshot(str(backup_dir), "backup_20240101_100000", snapshot(10, ["A", "B"]))
+
+    path = write_snapshot(
+        str(backup_dir), "backup_20240101_110000", snapshot(11, ["C", "D", "E"])
+    )
+    assert path.endswith(".md")
+
+
+def test_write_snapshot_normalizes_line_endings(tmp_path):
+    lines = [f"Line {i}" for i in range(10)]
+    write_snapshot(str(tmp_path), "backup_20240101_100000", snapshot(10, lines))
+
+    # Windows clipboard text, and a line overwritten in place with a CR
+    text = snapshot(11, lines + ["progress 50%\rprogress 100%"]).replace("\n", "\r\n")
+    path = write_snapshot(str(tmp_path), "backup_20240101_110000", text)
+
+    assert path.endswith(".delta")
+    expected = snapshot(11, lines + ["progress 50%", "progress 100%"])
+    assert read_snapshot(path) == expected
+
+    # A lone CR in LF text
+    text = snapshot(12, lines + ["progress 50%\rprogress 100%", "done"])
+    path = write_snapshot(str(tmp_path), "backup_20240101_120000", text)
+    assert path.endswith(".delta")
+    assert read_snapshot(path) == snapshot(
+        12, lines + ["progress 50%", "progress 100%", "done"]
+    )
+
+    records = list(BackupConsolidator(str(tmp_path)).iter_conversations())
+    assert len(records) == 3
+    assert records[-1].text.endswith("progress 100%\ndone")
+
+
+def test_read_snapshot_missing_base(tmp_path):
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+    lines = [f"Message {i}" for i in range(10)]
+    write_snapshot(str(backup_dir), "backup_20240101_100000", snapshot(10, lines))
+    path = write_snapshot(
+        str(backup_dir), "backup_20240101_110000", snapshot(11, lines + ["More"])
+    )
+    os.remove(backup_dir / "backup_20240101_100000.md")
+
+    with pytest.raises(DeltaError):
+        read_snapshot(path)
+
+
+def test_consolidate_and_prune_deltas(tmp_path):
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+    lines = [f"Message {i}" for i in range(10)]
+    for hour in (10, 11, 12):
+        lines.append(f"Reply at {hour}")
+        write_snapshot(
+            str(backup_dir), f"backup_20240101_{hour}0000", snapshot(hour, lines)
+        )
+
+    records = list(BackupConsolidator(str(backup_dir)).iter_conversations())
+    assert len(records) == 3
+    assert records[-1].text.endswith("Reply at 11\nReply at 12")
+
+    consolidator = BackupConsolidator(str(backup_dir), new_content_only=True)
+    texts = [r.text for r in consolidator.iter_conversations()]
+    assert texts[1:] == ["Reply at 11", "Reply at 12"]
+
+    # The newest delta still needs the older backups to be reconstructed
+    assert plan_prune(str(backup_dir), RetentionPolicy(keep_last=1)) == []
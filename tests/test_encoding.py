@@ -0,0 +1,55 @@
+"""Tests for the encoding module."""
+import codecs
+import json
+from cascade_backup_utils.consolidate import BackupConsolidator
+from cascade_backup_utils.encoding import (
+    decode_backup,
+    encode_text,
+    replace_undecodable,
+)
+from cascade_backup_utils.export import export_jsonl
+from cascade_backup_utils.index import ConsolidatedReader
+
+
+def test_line_endings_and_boms():
+    assert decode_backup(b"a\r\nb\rc\n") == "a\nb\nc\n"
+    assert decode_backup(codecs.BOM_UTF8 + b"caf\xc3\xa9\r\n") == "café\n"
+    for codec in ("utf-16-le", "utf-16-be"):
+        bom = codecs.BOM_UTF16_LE if codec == "utf-16-le" else codecs.BOM_UTF16_BE
+        assert decode_backup(bom + "café\r\nx".encode(codec)) == "café\nx"
+
+
+def test_undecodable_bytes_round_trip():
+    # A cp1252 right quote and a truncated UTF-8 sequence
+    data = b"it\x92s\n\xe2\x82"
+    text = decode_backup(data)
+    assert text == "it\udc92s\n\udce2\udc82"
+    assert encode_text(text) == data
+    assert replace_undecodable(text) == "it�s\n�"
+    assert replace_undecodable("café") == "café"
+
+
+def test_consolidate_keeps_windows_backups(tmp_path):
+    (tmp_path / "backup_2024-01-01_10-00-00.md").write_bytes(
+        codecs.BOM_UTF8
+        + b"*Backup created on: 2024-01-01 10:00:00*\r\n\r\nit\x92s here\r\nImage\r\n"
+    )
+    (tmp_path / "backup_2024-01-01_11-00-00.md").write_bytes(
+        b"*Backup created on: 2024-01-01 11:00:00*\n\nit\x92s here\n"
+    )
+    consolidator = BackupConsolidator(str(tmp_path))
+    consolidator.consolidate()
+
+    with open(consolidator.consolidated_file, "rb") as f:
+        data = f.read()
+    assert b"\r" not in data and not data.startswith(codecs.BOM_UTF8)
+    assert data.count(b"it\x92s here") == 1
+    with ConsolidatedReader(consolidator.consolidated_file) as reader:
+        assert len(reader) == 1
+        assert reader.section(0).endswith("it\udc92s here")
+
+    output = tmp_path / "export.jsonl"
+    export_jsonl(consolidator.iter_conversations(), str(output))
+    row = json.loads(output.read_text(encoding="utf-8"))
+    assert row["text"] == "it�s here"
+    assert row["byte_length"] == len(b"it\x92s here")
@@ -0,0 +1,146 @@
+"""Tests for the encryption module."""
+import logging
+import os
+import sys
+import pytest
+from unittest.mock import patch
+from cascade_backup_utils.__main__ import main
+from cascade_backup_utils.consolidate import BackupConsolidator
+from cascade_backup_utils.encryption import (
+    KEY_ENV_VAR,
+    KEYFILE_ENV_VAR,
+    EncryptionError,
+    decode_key,
+    generate_key,
+    load_key,
+    read_encrypted,
+    write_encrypted,
+    write_keyfile,
+)
+
+pytest.importorskip("cryptography")
+
+
+@pytest.fixture
+def key():
+    return decode_key(generate_key())
+
+
+@pytest.mark.parametrize("text", ["", "short", "✓ chunk boundary " * 40])
+def test_round_trip(tmp_path, key, text):
+    path = str(tmp_path / "backup.md.enc")
+    write_encrypted(path, text, key, chunk_size=16)
+
+    if text:
+        assert text.encode("utf-8") not in open(path, "rb").read()
+    assert read_encrypted(path, key) == text
+
+
+def test_wrong_key_tampering_and_truncation(tmp_path, key):
+    path = str(tmp_path / "backup.md.enc")
+    write_encrypted(path, "x" * 100, key, chunk_size=32)
+    data = open(path, "rb").read()
+
+    with pytest.raises(EncryptionError):
+        read_encrypted(path, decode_key(generate_key()))
+
+    tampered = bytearray(data)
+    tampered[-1] ^= 1
+    open(path, "wb").write(bytes(tampered))
+    with pytest.raises(EncryptionError):
+        read_encrypted(path, key)
+
+    # Dropping the final chunk leaves a valid-looking but incomplete file
+    open(path, "wb").write(data[: len(data) - (4 + 16)])
+    with pytest.raises(EncryptionError):
+        read_encrypted(path, key)
+
+
+def test_load_key(tmp_path, key, monkeypatch):
+    monkeypatch.delenv(KEY_ENV_VAR, raising=False)
+    monkeypatch.delenv(KEYFILE_ENV_VAR, raising=False)
+    with pytest.raises(EncryptionError):
+        load_key()
+
+    keyfile = str(tmp_path / "backup.key")
+    write_keyfile(keyfile)
+    assert os.stat(keyfile).st_mode & 0o777 == 0o600 or os.name == "nt"
+    with pytest.raises(FileExistsError):
+        write_keyfile(keyfile)
+
+    monkeypatch.setenv(KEYFILE_ENV_VAR, keyfile)
+    assert load_key() == load_key(keyfile)
+
+    monkeypatch.setenv(KEY_ENV_VAR, "not a key")
+    with pytest.raises(EncryptionError):
+        load_key()
+
+
+def test_consolidate_encrypted_backups(tmp_path, key, monkeypatch):
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+    write_encrypted(
+        str(backup_dir / "backup_2024-01-01_11-00-00.md.enc"),
+        "*Backup created on: 2024-01-01 11:00:00*\nSecret second",
+        key,
+    )
+    write_encrypted(
+        str(backup_dir / "notes.md.enc"),
+        "*Backup created on: 2024-01-01 10:00:00*\nSecret first",
+        key,
+    )
+    (backup_dir / "backup_2024-01-01_12-00-00.md").write_text(
+        "*Backup created on: 2024-01-01 12:00:00*\nPlain third"
+    )
+
+    # An explicit key takes precedence over the environment
+    monkeypatch.setenv(KEY_ENV_VAR, generate_key())
+    consolidator = BackupConsolidator(str(backup_dir), key=key)
+    consolidator.consolidate()
+    assert consolidator.timestamp_sources[str(backup_dir / "notes.md.enc")] == "header"
+
+    with open(consolidator.consolidated_file, encoding="utf-8") as f:
+        content = f.read()
+    assert content.index("Secret first") < content.index("Secret second")
+    assert content.index("Secret second") < content.index("Plain third")
+
+
+def test_consolidate_without_key(tmp_path, key, monkeypatch, caplog):
+    caplog.set_level(logging.INFO, logger="cascade_backup_utils")
+    monkeypatch.delenv(KEY_ENV_VAR, raising=False)
+    monkeypatch.delenv(KEYFILE_ENV_VAR, raising=False)
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+    write_encrypted(
+        str(backup_dir / "backup_2024-01-01_10-00-00.md.enc"), "Secret", key
+    )
+
+    BackupConsolidator(str(backup_dir)).consolidate()
+    assert "No encryption key" in caplog.text
+    assert "No valid content found to consolidate." in caplog.text
+
+
+@pytest.mark.parametrize("command", ["consolidate", "batch", "export"])
+def test_cli_reads_with_keyfile(tmp_path, monkeypatch, command):
+    monkeypatch.delenv(KEY_ENV_VAR, raising=False)
+    monkeypatch.delenv(KEYFILE_ENV_VAR, raising=False)
+    keyfile = str(tmp_path / "backup.key")
+    write_keyfile(keyfile)
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+    write_encrypted(
+        str(backup_dir / "backup_2024-01-01_10-00-00.md.enc"),
+        "*Backup created on: 2024-01-01 10:00:00*\nSecret",
+        load_key(keyfile),
+    )
+
+    output = backup_dir / "consolidated_conversation.md"
+    args = [command, str(backup_dir)]
+    if command == "export":
+        output = tmp_path / "export.jsonl"
+        args = [command, str(output), "--dir", str(backup_dir)]
+    argv = ["cascade_backup_utils"] + args + ["--keyfile", keyfile]
+    with patch.object(sys, "argv", argv):
+        main()
+
+    assert "Secret" in output.read_text(encoding="utf-8")
@@ -0,0 +1,56 @@
+"""Tests for the export module."""
+import json
+import os
+import sys
+import pytest
+from cascade_backup_utils.consolidate import BackupConsolidator
+from cascade_backup_utils.export import export_parquet, export_records
+
+
+@pytest.fixture
+def consolidator(tmp_path):
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+    for hour, text in ((11, "Second"), (10, "First ✓")):
+        (backup_dir / f"backup_2024-01-01_{hour}-00-00.md").write_text(
+            f"*Backup created on: 2024-01-01 {hour}:00:00*\n{text}", encoding="utf-8"
+        )
+    return BackupConsolidator(str(backup_dir))
+
+
+def test_export_jsonl(consolidator, tmp_path):
+    output = tmp_path / "conversations.jsonl"
+    assert consolidator.export(str(output)) == 2
+
+    lines = output.read_text(encoding="utf-8").splitlines()
+    rows = [json.loads(line) for line in lines]
+    assert [row["text"] for row in rows] == ["First ✓", "Second"]
+    assert rows[0]["timestamp"] == "2024-01-01T10:00:00"
+    assert rows[0]["byte_length"] == len("First ✓".encode("utf-8"))
+    assert len(rows[0]["digest"]) == 64
+    assert rows[0]["path"].endswith("backup_2024-01-01_10-00-00.md")
+
+
+def test_export_parquet(consolidator, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    output = tmp_path / "conversations.parquet"
+
+    count = export_parquet(consolidator.iter_conversations(), str(output), 1)
+    assert count == 2
+
+    parquet_file = pq.ParquetFile(str(output))
+    assert parquet_file.metadata.num_row_groups == 2
+    table = parquet_file.read()
+    assert table.column("text").to_pylist() == ["First ✓", "Second"]
+    assert table.column("timestamp").to_pylist()[1].hour == 11
+
+
+def test_export_parquet_without_pyarrow(consolidator, tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    with pytest.raises(ImportError, match="pyarrow"):
+        consolidator.export(str(tmp_path / "out.parquet"))
+
+
+def test_export_unsupported_format(tmp_path):
+    with pytest.raises(ValueError):
+        export_records([], str(tmp_path / "out.csv"), "csv")
@@ -0,0 +1,108 @@
+"""Tests for the external module."""
+import os
+import random
+import pytest
+from datetime import datetime, timedelta
+from cascade_backup_utils.consolidate import BackupConsolidator
+from cascade_backup_utils.external import DigestStore, FileIndex
+
+
+def test_file_index_sorts_on_disk(tmp_path):
+    random.seed(0)
+    start = datetime(2024, 1, 1)
+    entries = [
+        (f"file_{i}.md", start + timedelta(seconds=random.randrange(500)))
+        for i in range(5000)
+    ]
+
+    with FileIndex(cache_kib=64, directory=str(tmp_path)) as index:
+        for path, timestamp in entries:
+            index.add(path, timestamp)
+        assert len(index) == 5000
+        assert list(index.paths()) == [path for path, _ in entries]
+        # Equal timestamps keep insertion order, like a stable sort
+        assert list(index.iter_sorted()) == sorted(entries, key=lambda x: x[1])
+    assert os.listdir(tmp_path) == []
+
+
+def test_digest_store_commit_and_truncate(tmp_path):
+    path = str(tmp_path / "digests")
+    digests = [f"{i:064x}" for i in range(4)]
+
+    store = DigestStore(path, cache_kib=64)
+    store.add(digests[0])
+    store.add(digests[1])
+    rows = store.commit()
+    store.add(digests[2])
+    assert digests[2] in store
+    store.close()
+
+    # Uncommitted digests are lost, like after a crash
+    store = DigestStore(path, cache_kib=64)
+    assert digests[1] in store and digests[2] not in store
+    store.add(digests[3])
+    store.truncate(rows)
+    assert digests[3] not in store
+    store.close(remove=True)
+    assert not os.path.exists(path)
+
+
+@pytest.fixture
+def backup_dirs(tmp_path):
+    dirs = []
+    for name, hours in (("a", range(0, 24, 2)), ("b", range(1, 24, 2))):
+        backup_dir = tmp_path / name
+        os.makedirs(backup_dir, exist_ok=True)
+        for hour in hours:
+            (backup_dir / f"backup_2024-01-01_{hour:02d}-00-00.md").write_text(
+                f"*Backup created on: 2024-01-01 {hour:02d}:00:00*\n"
+                f"Conversation {hour % 5}\nImage"
+            )
+        dirs.append(str(backup_dir))
+    return dirs
+
+
+def consolidated_text(consolidator):
+    with open(consolidator.consolidated_file, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_bounded_memory_matches_default(backup_dirs, tmp_path):
+    default = BackupConsolidator(backup_dirs[0], extra_dirs=backup_dirs[1:])
+    default.consolidated_file = str(tmp_path / "default.md")
+    default.consolidate()
+
+    bounded = BackupConsolidator(
+        backup_dirs[0], extra_dirs=backup_dirs[1:], memory_limit=1
+    )
+    bounded.consolidate()
+
+    assert consolidated_text(bounded) == consolidated_text(default)
+    assert consolidated_text(bounded).count("---") == 4
+    assert bounded.timestamp_sources == {}
+    assert not [n for n in os.listdir(backup_dirs[0]) if n.endswith(".sqlite")]
+
+
+def test_bounded_memory_resume(backup_dirs, monkeypatch):
+    consolidator = BackupConsolidator(backup_dirs[0], memory_limit=1)
+    consolidator.checkpoint_interval = 0
+    load_record = consolidator._load_record
+
+    def crashing_load(file_path, timestamp):
+        if timestamp.hour == 8:
+            raise KeyboardInterrupt
+        return load_record(file_path, timestamp)
+
+    monkeypatch.setattr(consolidator, "_load_record", crashing_load)
+    with pytest.raises(KeyboardInterrupt):
+        consolidator.consolidate()
+    assert os.path.exists(consolidator.consolidated_file + ".digests")
+
+    resumed = BackupConsolidator(backup_dirs[0], memory_limit=1)
+    resumed.consolidate()
+    fresh = BackupConsolidator(backup_dirs[0])
+    fresh.consolidated_file += ".fresh"
+    fresh.consolidate()
+
+    assert consolidated_text(resumed) == consolidated_text(fresh)
+    assert not os.path.exists(resumed.consolidated_file + ".digests")
@@ -0,0 +1,52 @@
+"""Tests for the index module."""
+import os
+import pytest
+from datetime import datetime
+from cascade_backup_utils.consolidate import BackupConsolidator
+from cascade_backup_utils.index import ConsolidatedReader, SectionIndexError
+from cascade_backup_utils.serve import ConsolidationService
+
+
+@pytest.fixture
+def consolidator(tmp_path):
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+    for hour in (10, 11, 12):
+        (backup_dir / f"backup_2024-01-01_{hour}-00-00.md").write_text(
+            f"*Backup created on: 2024-01-01 {hour}:00:00*\nConversation {hour} ✓",
+            encoding="utf-8",
+        )
+    return BackupConsolidator(str(backup_dir))
+
+
+def test_lookup_by_timestamp(consolidator):
+    consolidator.consolidate()
+    records = list(consolidator.iter_conversations())
+
+    with ConsolidatedReader(consolidator.consolidated_file) as reader:
+        assert len(reader) == 3
+        assert [reader.entry(i).digest for i in range(3)] == [r.digest for r in records]
+        assert reader.section(1) == records[1].section
+        assert reader.at(datetime(2024, 1, 1, 11, 30)) == records[1].section
+        assert reader.at(datetime(2024, 1, 1, 12)) == records[2].section
+        assert reader.at(datetime(2024, 1, 1, 9, 59)) is None
+
+
+def test_index_follows_appends_and_detects_staleness(consolidator):
+    service = ConsolidationService(consolidator)
+    service.poll_once()
+    backup_dir = consolidator.backup_dir
+    with open(
+        os.path.join(backup_dir, "backup_2024-01-01_13-00-00.md"), "w", encoding="utf-8"
+    ) as f:
+        f.write("*Backup created on: 2024-01-01 13:00:00*\nConversation 13")
+    assert service.poll_once() == "appended"
+
+    with ConsolidatedReader(consolidator.consolidated_file) as reader:
+        assert len(reader) == 4
+        assert reader.at(datetime(2025, 1, 1)).endswith("Conversation 13")
+
+    with open(consolidator.consolidated_file, "a", encoding="utf-8") as f:
+        f.write("edited by hand")
+    with pytest.raises(SectionIndexError):
+        ConsolidatedReader(consolidator.consolidated_file)
@@ -1,6 +1,8 @@
+import json
 import os
 import sys
 import pytest
+from datetime import datetime
 from unittest.mock import patch
 from cascade_backup_utils.__main__ import main
 from cascade_backup_utils.backup import CascadeBackup
@@ -59,23 +61,10 @@ def test_main_consolidate(tmp_path, monkeypatch):
         (backup_dir / filename).write_text(content)
 
     # Mock backup directory initialization
+    original_init = BackupConsolidator.__init__
+
     def mock_init(self):
-        self.backup_dir = str(backup_dir)
-        self.consolidated_file = str(backup_dir / "consolidated_conversation.md")
-        self.ui_messages = [
-            "DoneFeedback has been submitted",
-            "Start with History Ctrl+Enter",
-            "Press Enter again to interrupt and send a new message",
-            "Image",
-            "Claude 3.5 Sonnet",
-            "Write",
-            "Chat",
-            "ChatWriteLegacy",
-            "Legacy",
-            "Changes overview (0 files need review)",
-            "GPT-4o",
-            "Cascade |  mode (Ctrl + .)",
-        ]
+        original_init(self, str(backup_dir))
 
     monkeypatch.setattr(BackupConsolidator, "__init__", mock_init)
 
@@ -117,3 +106,139 @@ def test_main_no_command(capsys):
     # Check error message
     captured = capsys.readouterr()
     assert "Usage:" in captured.out
+
+
+def test_main_consolidate_multiple_dirs(tmp_path):
+    dir_a = tmp_path / "a"
+    dir_b = tmp_path / "b"
+    os.makedirs(dir_a, exist_ok=True)
+    os.makedirs(dir_b, exist_ok=True)
+    (dir_a / "backup_2024-01-01_10-00-00.md").write_text(
+        "*Backup created on: 2024-01-01 10:00:00*\nFrom A"
+    )
+    (dir_b / "backup_2024-01-01_11-00-00.md").write_text(
+        "*Backup created on: 2024-01-01 11:00:00*\nFrom B"
+    )
+
+    argv = ["cascade_backup_utils", "consolidate", str(dir_a), str(dir_b)]
+    with patch.object(sys, "argv", argv):
+        main()
+
+    consolidated_content = (dir_a / "consolidated_conversation.md").read_text()
+    assert "From A" in consolidated_content
+    assert "From B" in consolidated_content
+
+
+def test_main_batch_glob(tmp_path):
+    for name in ("proj_1", "proj_2"):
+        backup_dir = tmp_path / name
+        os.makedirs(backup_dir, exist_ok=True)
+        (backup_dir / "backup_2024-01-01_10-00-00.md").write_text(
+            f"*Backup created on: 2024-01-01 10:00:00*\nContent of {name}"
+        )
+
+    argv = ["cascade_backup_utils", "batch", str(tmp_path / "proj_*")]
+    with patch.object(sys, "argv", argv):
+        main()
+
+    for name in ("proj_1", "proj_2"):
+        consolidated_file = tmp_path / name / "consolidated_conversation.md"
+        assert f"Content of {name}" in consolidated_file.read_text()
+
+
+def test_main_consolidate_quiet_with_metrics(tmp_path, capsys):
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+    (backup_dir / "backup_2024-01-01_10-00-00.md").write_text(
+        "*Backup created on: 2024-01-01 10:00:00*\nContent"
+    )
+    metrics_file = tmp_path / "metrics.json"
+
+    argv = ["cascade_backup_utils", "consolidate", str(backup_dir), "-q"]
+    argv += ["--metrics-file", str(metrics_file)]
+    with patch.object(sys, "argv", argv):
+        main()
+
+    assert "Consolidated file saved" not in capsys.readouterr().err
+    metrics = json.loads(metrics_file.read_text())
+    assert metrics["cascade_consolidate_seconds"]["values"][0]["count"] >= 1
+
+
+def test_main_batch_no_match(tmp_path, capsys):
+    argv = ["cascade_backup_utils", "batch", str(tmp_path / "missing_*")]
+    with patch.object(sys, "argv", argv):
+        with pytest.raises(SystemExit) as exc_info:
+            main()
+    assert exc_info.value.code == 1
+    assert "No backup directories matched" in capsys.readouterr().out
+
+
+def test_main_prune(tmp_path):
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+    for day in (1, 2, 3):
+        (backup_dir / f"backup_2024-01-0{day}_10-00-00.md").write_text(
+            f"*Backup created on: 2024-01-0{day} 10:00:00*\nDay {day}"
+        )
+
+    argv = ["cascade_backup_utils", "prune", str(backup_dir), "--keep-last", "1"]
+    with patch.object(sys, "argv", argv):
+        main()
+
+    assert os.listdir(backup_dir) == ["backup_2024-01-03_10-00-00.md"]
+
+
+@pytest.mark.parametrize("count", ["0", "-1", "two"])
+def test_main_prune_rejects_non_positive_counts(tmp_path, capsys, count):
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+    for day in (1, 2):
+        (backup_dir / f"backup_2024-01-0{day}_10-00-00.md").write_text(
+            f"*Backup created on: 2024-01-0{day} 10:00:00*\nDay {day}"
+        )
+
+    argv = ["cascade_backup_utils", "prune", str(backup_dir), "--keep-last", count]
+    with patch.object(sys, "argv", argv):
+        with pytest.raises(SystemExit) as exc_info:
+            main()
+    assert exc_info.value.code == 2
+    assert "must be a positive integer" in capsys.readouterr().err
+    assert len(os.listdir(backup_dir)) == 2
+
+
+def test_main_prune_without_policy(tmp_path, capsys):
+    argv = ["cascade_backup_utils", "prune", str(tmp_path)]
+    with patch.object(sys, "argv", argv):
+        with pytest.raises(SystemExit) as exc_info:
+            main()
+    assert exc_info.value.code == 1
+    assert "No retention policy" in capsys.readouterr().out
+
+
+def test_main_show(tmp_path, capsys):
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+    for hour in (10, 11):
+        (backup_dir / f"backup_2024-01-01_{hour}-00-00.md").write_text(
+            f"*Backup created on: 2024-01-01 {hour}:00:00*\nContent {hour}"
+        )
+    BackupConsolidator(str(backup_dir)).consolidate()
+    capsys.readouterr()
+
+    argv = ["cascade_backup_utils", "show", str(backup_dir), "--at", "2024-01-01T10:30"]
+    with patch.object(sys, "argv", argv):
+        main()
+    assert capsys.readouterr().out.strip().endswith("Content 10")
+
+    # The same time with a UTC offset
+    argv[-1] = datetime(2024, 1, 1, 10, 30).astimezone().isoformat()
+    with patch.object(sys, "argv", argv):
+        main()
+    assert capsys.readouterr().out.strip().endswith("Content 10")
+
+    argv[-1] = "2023-12-31T00:00"
+    with patch.object(sys, "argv", argv):
+        with pytest.raises(SystemExit) as exc_info:
+            main()
+    assert exc_info.value.code == 1
+    assert "No conversation found" in capsys.readouterr().out
@@ -0,0 +1,85 @@
+"""Tests for the metrics module."""
+import json
+import logging
+import os
+import pytest
+from cascade_backup_utils.consolidate import BackupConsolidator
+from cascade_backup_utils.metrics import (
+    BYTES_PROCESSED,
+    FILE_SECONDS,
+    FILES_CONSOLIDATED,
+    REGISTRY,
+    MetricsRegistry,
+)
+
+
+def test_counter_and_histogram_prometheus_format():
+    registry = MetricsRegistry()
+    counter = registry.counter("files_total", "Files seen.", ("result",))
+    histogram = registry.histogram("load_seconds", "Load time.", buckets=(0.1, 1))
+
+    counter.inc(result="ok")
+    counter.labels(result="ok").inc()
+    counter.inc(2, result='say "hi"')
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    assert counter.value(result="ok") == 2
+    with pytest.raises(ValueError):
+        counter.inc(kind="ok")
+    assert registry.to_prometheus().splitlines() == [
+        "# HELP files_total Files seen.",
+        "# TYPE files_total counter",
+        'files_total{result="ok"} 2',
+        'files_total{result="say \\"hi\\""} 2',
+        "# HELP load_seconds Load time.",
+        "# TYPE load_seconds histogram",
+        'load_seconds_bucket{le="0.1"} 1',
+        'load_seconds_bucket{le="1"} 2',
+        'load_seconds_bucket{le="+Inf"} 3',
+        "load_seconds_sum 5.55",
+        "load_seconds_count 3",
+    ]
+
+
+def test_write_json_and_prometheus(tmp_path):
+    registry = MetricsRegistry()
+    registry.counter("runs_total", "Runs.").inc()
+    with registry.histogram("run_seconds", "Run time.").time():
+        pass
+
+    registry.write(str(tmp_path / "metrics.json"))
+    data = json.loads((tmp_path / "metrics.json").read_text())
+    assert data["runs_total"]["values"] == [{"labels": {}, "value": 1}]
+    assert data["run_seconds"]["values"][0]["count"] == 1
+
+    registry.write(str(tmp_path / "metrics.prom"))
+    assert "runs_total 1" in (tmp_path / "metrics.prom").read_text()
+    assert sorted(os.listdir(tmp_path)) == ["metrics.json", "metrics.prom"]
+
+    with pytest.raises(ValueError):
+        registry.write(str(tmp_path / "metrics.txt"), "xml")
+
+
+def test_consolidate_records_metrics(tmp_path, caplog):
+    caplog.set_level(logging.DEBUG, logger="cascade_backup_utils")
+    REGISTRY.reset()
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+    for hour, text in ((10, "Same"), (11, "Same"), (12, "Other")):
+        (backup_dir / f"backup_2024-01-01_{hour}-00-00.md").write_text(
+            f"*Backup created on: 2024-01-01 {hour}:00:00*\n{text}"
+        )
+
+    BackupConsolidator(str(backup_dir)).consolidate()
+
+    assert FILES_CONSOLIDATED.value(result="unique") == 2
+    assert FILES_CONSOLIDATED.value(result="duplicate") == 1
+    assert BYTES_PROCESSED.value() == sum(
+        os.path.getsize(backup_dir / name)
+        for name in os.listdir(backup_dir)
+        if name.startswith("backup_")
+    )
+    assert FILE_SECONDS._to_dict()[0]["count"] == 3
+    assert "Skipping duplicate content" in caplog.text
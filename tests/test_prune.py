@@ -0,0 +1,108 @@
+"""Tests for the prune module."""
+import logging
+import os
+import pytest
+from cascade_backup_utils.prune import RetentionPolicy, plan_prune, prune
+
+
+def write_backups(backup_dir, backups):
+    """Write (timestamp, text) backups named after their timestamp."""
+    os.makedirs(backup_dir, exist_ok=True)
+    for timestamp, text in backups:
+        name = timestamp.replace(" ", "_").replace(":", "-")
+        (backup_dir / f"backup_{name}.md").write_text(
+            f"*Backup created on: {timestamp}*\n{text}"
+        )
+
+
+def names(paths):
+    return [os.path.basename(p) for p in paths]
+
+
+def test_keep_last(tmp_path):
+    backup_dir = tmp_path / "backups"
+    write_backups(
+        backup_dir,
+        [(f"2024-01-0{day} 10:00:00", f"Day {day}") for day in range(1, 6)],
+    )
+
+    to_delete = plan_prune(str(backup_dir), RetentionPolicy(keep_last=2))
+
+    assert names(to_delete) == [
+        "backup_2024-01-01_10-00-00.md",
+        "backup_2024-01-02_10-00-00.md",
+        "backup_2024-01-03_10-00-00.md",
+    ]
+
+
+def test_keep_daily_and_monthly(tmp_path):
+    backup_dir = tmp_path / "backups"
+    write_backups(
+        backup_dir,
+        [
+            ("2024-01-15 10:00:00", "January"),
+            ("2024-02-10 09:00:00", "February morning"),
+            ("2024-02-10 18:00:00", "February evening"),
+            ("2024-02-11 09:00:00", "Next day morning"),
+            ("2024-02-11 18:00:00", "Next day evening"),
+        ],
+    )
+
+    policy = RetentionPolicy(keep_daily=2, keep_monthly=2)
+    to_delete = plan_prune(str(backup_dir), policy)
+
+    assert names(to_delete) == [
+        "backup_2024-02-10_09-00-00.md",
+        "backup_2024-02-11_09-00-00.md",
+    ]
+
+
+def test_drop_contained(tmp_path):
+    backup_dir = tmp_path / "backups"
+    write_backups(
+        backup_dir,
+        [
+            ("2024-01-01 10:00:00", "Question"),
+            ("2024-01-01 11:00:00", "Question\nAnswer"),
+            ("2024-01-01 12:00:00", "A new conversation"),
+            ("2024-01-01 13:00:00", "Question\nAnswer\nFollow-up"),
+        ],
+    )
+
+    to_delete = plan_prune(str(backup_dir), RetentionPolicy(drop_contained=True))
+
+    # A different conversation in between doesn't stop the first two going
+    assert names(to_delete) == [
+        "backup_2024-01-01_10-00-00.md",
+        "backup_2024-01-01_11-00-00.md",
+    ]
+
+
+def test_prune_dry_run_and_delete(tmp_path, caplog):
+    caplog.set_level(logging.INFO, logger="cascade_backup_utils")
+    backup_dir = tmp_path / "backups"
+    write_backups(
+        backup_dir,
+        [("2024-01-01 10:00:00", "Old"), ("2024-01-02 10:00:00", "New")],
+    )
+    (backup_dir / "notes.md").write_text("No timestamp anywhere")
+    policy = RetentionPolicy(keep_last=1)
+
+    deleted = prune(str(backup_dir), policy, dry_run=True)
+    assert names(deleted) == ["backup_2024-01-01_10-00-00.md"]
+    assert (backup_dir / "backup_2024-01-01_10-00-00.md").exists()
+    assert "Would delete" in caplog.text
+
+    deleted = prune(str(backup_dir), policy)
+    assert names(deleted) == ["backup_2024-01-01_10-00-00.md"]
+    assert sorted(os.listdir(backup_dir)) == [
+        "backup_2024-01-02_10-00-00.md",
+        "notes.md",
+    ]
+
+
+@pytest.mark.parametrize("rule", ["keep_last", "keep_daily", "keep_monthly"])
+@pytest.mark.parametrize("count", [0, -1])
+def test_policy_rejects_counts_below_one(rule, count):
+    with pytest.raises(ValueError):
+        RetentionPolicy(**{rule: count})
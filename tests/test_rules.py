@@ -0,0 +1,105 @@
+"""Tests for the noise rules module."""
+import json
+import os
+import pytest
+from cascade_backup_utils.consolidate import BackupConsolidator
+from cascade_backup_utils.rules import (
+    MATCHER_CACHE_SIZE,
+    NoiseRules,
+    compile_rules,
+    load_rules,
+)
+
+
+def test_default_rules_keep_real_lines():
+    rules = NoiseRules()
+
+    assert rules.matches("DoneFeedback has been submitted")
+    assert rules.matches("  Image  ")
+    assert rules.matches("Chat")
+    # Broad words only match as whole lines, not inside conversation text
+    assert not rules.matches("Write a function that parses the Image header")
+    assert not rules.matches("Chat history is stored locally")
+
+
+def test_compile_rules_literal_regex_and_line():
+    matcher = compile_rules(
+        {"literals": ["a.b"], "regexes": [r"^\d+ files? changed$"], "lines": ["Done"]}
+    )
+
+    assert matcher.matches("xx a.b yy")
+    assert not matcher.matches("axb")
+    assert matcher.matches("3 files changed")
+    assert not matcher.matches("see: 3 files changed")
+    assert matcher.matches(" Done ")
+    assert not matcher.matches("Done with it")
+
+
+def test_compile_rules_cached_by_hash():
+    first = compile_rules({"literals": ["x"], "lines": ["y"]})
+    second = compile_rules({"lines": ["y"], "literals": ["x"], "regexes": []})
+    assert first is second
+
+    # Only the most recently used rule sets are kept
+    for i in range(MATCHER_CACHE_SIZE):
+        compile_rules({"literals": [f"rule {i}"]})
+    assert compile_rules({"literals": ["x"], "lines": ["y"]}) is not first
+
+
+def test_invalid_rules(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"literals": "not a list"}))
+    with pytest.raises(ValueError):
+        load_rules(str(path))
+
+    with pytest.raises(ValueError):
+        compile_rules({"regexes": ["("]})
+
+
+def test_rules_reload_on_change(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"literals": ["first"]}))
+    rules = NoiseRules(str(path))
+    assert rules.matches("the first line")
+    assert not rules.reload_if_changed()
+
+    path.write_text(json.dumps({"literals": ["second one"]}))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert rules.reload_if_changed()
+    assert rules.matches("the second one")
+    assert not rules.matches("the first line")
+
+
+def test_consolidate_uses_rules_file(tmp_path):
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+    (backup_dir / "noise_rules.json").write_text(json.dumps({"lines": ["Noise"]}))
+    (backup_dir / "backup_2024-01-01_10-00-00.md").write_text(
+        "*Backup created on: 2024-01-01 10:00:00*\nNoise\nImage\nKept line"
+    )
+
+    consolidator = BackupConsolidator(str(backup_dir))
+    consolidator.consolidate()
+
+    consolidated_content = (backup_dir / "consolidated_conversation.md").read_text()
+    assert "Noise" not in consolidated_content
+    assert "Image" in consolidated_content
+    assert "Kept line" in consolidated_content
+
+
+def test_remove_lines_matches_line_filter():
+    matcher = compile_rules(
+        {
+            "literals": ["noise"],
+            "regexes": [r"^\d+$", r"end$", "^$"],
+            "lines": ["Skip me"],
+        }
+    )
+    text = "keep\nnoise here\n123\n12a\n  Skip me \nSkip me too\nthe end\n\n  \nlast"
+
+    expected = "\n".join(
+        line for line in text.split("\n") if line.strip() and not matcher.matches(line)
+    )
+    assert matcher.remove_lines(text) == expected
+    assert expected == "keep\n12a\nSkip me too\nlast"
@@ -0,0 +1,127 @@
+"""Tests for the serve module."""
+
+import json
+import os
+import pytest
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.request import urlopen
+from cascade_backup_utils.consolidate import BackupConsolidator
+from cascade_backup_utils.index import ConsolidatedReader
+from cascade_backup_utils.serve import ConsolidationService, start_http_server
+
+
+def write_backup(backup_dir, hour, text):
+    (backup_dir / f"backup_2024-01-01_{hour:02d}-00-00.md").write_text(
+        f"*Backup created on: 2024-01-01 {hour:02d}:00:00*\n{text}"
+    )
+
+
+@pytest.fixture
+def service(tmp_path):
+    backup_dir = tmp_path / "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+    write_backup(backup_dir, 10, "First")
+    return ConsolidationService(BackupConsolidator(str(backup_dir)))
+
+
+def read_output(service):
+    with open(service.consolidator.consolidated_file, encoding="utf-8") as f:
+        return f.read()
+
+
+def full_consolidation(service):
+    """Output of a one-off consolidation, for comparison."""
+    consolidator = BackupConsolidator(service.consolidator.backup_dir)
+    consolidator.consolidated_file = service.consolidator.consolidated_file + ".ref"
+    consolidator.consolidate()
+    with open(consolidator.consolidated_file, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_poll_appends_new_backups(service):
+    backup_dir = Path(service.consolidator.backup_dir)
+    assert service.poll_once() == "rebuilt"
+    assert service.poll_once() is None
+
+    write_backup(backup_dir, 11, "Second")
+    write_backup(backup_dir, 12, "First")
+    assert service.poll_once() == "appended"
+    assert len(service.sections) == 2
+    assert read_output(service) == full_consolidation(service)
+
+
+def test_poll_rebuilds_on_older_or_changed_backup(service):
+    backup_dir = Path(service.consolidator.backup_dir)
+    service.poll_once()
+    write_backup(backup_dir, 12, "Third")
+    service.poll_once()
+
+    # A backup older than the consolidated output forces a rebuild
+    write_backup(backup_dir, 11, "Second")
+    assert service.poll_once() == "rebuilt"
+    output = read_output(service)
+    assert output.index("Second") < output.index("Third")
+
+    # So does a deleted backup
+    os.remove(backup_dir / "backup_2024-01-01_12-00-00.md")
+    assert service.poll_once() == "rebuilt"
+    assert "Third" not in read_output(service)
+    assert sorted(service.consolidator.timestamp_sources) == sorted(
+        str(path) for path in backup_dir.glob("backup_*.md")
+    )
+    assert read_output(service) == full_consolidation(service)
+
+
+def test_interrupted_rebuild_keeps_output(service, monkeypatch):
+    backup_dir = Path(service.consolidator.backup_dir)
+    write_backup(backup_dir, 12, "Third")
+    service.poll_once()
+    previous = read_output(service)
+
+    write_backup(backup_dir, 11, "Second")
+    load_record = service.consolidator._load_record
+
+    def crashing_load(file_path, timestamp):
+        if file_path.endswith("12-00-00.md"):
+            raise KeyboardInterrupt
+        return load_record(file_path, timestamp)
+
+    monkeypatch.setattr(service.consolidator, "_load_record", crashing_load)
+    with pytest.raises(KeyboardInterrupt):
+        service.poll_once()
+
+    assert read_output(service) == previous
+    assert not list(backup_dir.glob("*.partial*"))
+    with ConsolidatedReader(service.consolidator.consolidated_file) as reader:
+        assert len(reader) == 2
+
+
+def test_http_endpoints(service):
+    service.poll_once()
+    server = start_http_server(service, port=0)
+    base = f"http://127.0.0.1:{server.server_port}"
+    try:
+        with urlopen(f"{base}/status") as response:
+            status = json.load(response)
+        assert status["conversations"] == 1
+        assert status["last_timestamp"] == "2024-01-01T10:00:00"
+
+        with urlopen(f"{base}/conversations?since=2024-01-01T09:00") as response:
+            conversations = json.load(response)
+        assert [c["timestamp"] for c in conversations] == ["2024-01-01T10:00:00"]
+
+        digest = conversations[0]["digest"]
+        with urlopen(f"{base}/conversation?digest={digest}") as response:
+            assert response.read().decode("utf-8").endswith("\nFirst")
+
+        with pytest.raises(HTTPError) as exc_info:
+            urlopen(f"{base}/conversation?digest=missing")
+        assert exc_info.value.code == 404
+
+        with urlopen(f"{base}/metrics") as response:
+            metrics = response.read().decode("utf-8")
+        assert 'cascade_consolidate_files_total{result="unique"}' in metrics
+    finally:
+        server.shutdown()
+        server.server_close()